@@ -0,0 +1,106 @@
+"""
+Offline Telegram Bot API backend for the benchmark harness
+
+Plugs into the Application as its request object and answers every Bot
+API call locally, so handlers run end to end without reaching Telegram.
+"""
+import asyncio
+import json
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from telegram.request import BaseRequest, RequestData
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'ZulianTV Bench', 'username': 'zuliantv_bench_bot'}
+
+# Command the current update belongs to, so replies can be attributed to it
+current_command: ContextVar[Optional[str]] = ContextVar('current_command', default=None)
+
+# Replies starting with these mean the handler reported a failure
+ERROR_PREFIXES = ('❌', '⏳', 'Error')
+
+
+class FakeTelegramRequest(BaseRequest):
+    """
+    BaseRequest that fabricates successful Bot API responses
+
+    Each call waits ``latency`` seconds to stand in for the round trip to
+    Telegram. API calls are counted per method, replies that report an
+    error are counted per command (see current_command), and the button
+    callback data last sent to each chat is kept so users can press them.
+    Uploaded file bytes are counted, and each uploaded photo gets a fake
+    file_id, as Telegram would assign.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.error_replies: Counter = Counter()
+        self.buttons: Dict[int, List[str]] = {}
+        self.upload_bytes = 0
+        self._message_ids = 0
+        self._file_ids = 0
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _message(self, params: Dict) -> Dict:
+        self._message_ids += 1
+        chat_id = params.get('chat_id', 0)
+        return {
+            'message_id': params.get('message_id', self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text', '')
+        }
+
+    def _photo_message(self, params: Dict) -> Dict:
+        self._file_ids += 1
+        message = self._message(params)
+        message['photo'] = [{
+            'file_id': f'bench-photo-{self._file_ids}', 'file_unique_id': f'bench-{self._file_ids}',
+            'width': 300, 'height': 450
+        }]
+        return message
+
+    def _result(self, api_method: str, params: Dict):
+        if api_method == 'getMe':
+            return BOT_USER
+        if api_method == 'sendMediaGroup':
+            return [self._photo_message(params) for _ in params.get('media', ())]
+        if api_method == 'sendPhoto':
+            return self._photo_message(params)
+        if api_method in ('sendMessage', 'editMessageText', 'sendDocument'):
+            text = params.get('text') or ''
+            if text.startswith(ERROR_PREFIXES):
+                self.error_replies[current_command.get()] += 1
+            markup = params.get('reply_markup')
+            if isinstance(markup, dict):
+                self.buttons[params.get('chat_id')] = [
+                    button['callback_data'] for row in markup.get('inline_keyboard', [])
+                    for button in row if 'callback_data' in button
+                ]
+            return self._message(params)
+        return True
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        api_method = url.rsplit('/', 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data is not None else {}
+        if request_data is not None and request_data.multipart_data:
+            self.upload_bytes += sum(len(part[1]) for part in request_data.multipart_data.values())
+        body = {'ok': True, 'result': self._result(api_method, params)}
+        return 200, json.dumps(body).encode()
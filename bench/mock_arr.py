@@ -0,0 +1,281 @@
+"""
+Mock Sonarr and Radarr API servers for the benchmark harness
+
+Serves the /api/v3 endpoints the bot uses from a generated catalog, with
+configurable response latency and failure injection. The first
+``library_size`` catalog titles are in the library; the rest can only be
+found through lookups and added.
+"""
+import argparse
+import asyncio
+import io
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from aiohttp import web
+from PIL import Image
+
+WORDS = (
+    'alpha amber anchor arrow atlas autumn blade blue border bridge broken burning canyon castle '
+    'chronicle circle city clear cold crimson crown crystal dark dawn dead deep desert diamond dream '
+    'eagle echo edge empire end falcon fallen fire first forest frozen garden ghost glass gold grand '
+    'green harbor haven heart hidden high hollow house hunter iron island jade jungle king lake last '
+    'legacy light lion lost lucky machine midnight mirror moon mountain night north ocean orbit '
+    'origin paper phoenix pirate planet quiet rain raven red river road rogue royal rising saint '
+    'secret shadow silent silver sky smoke snow song south star stone storm summer sun sword '
+    'thunder tide tiger tower twin valley velvet violet war water west whisper white wild wind winter '
+    'wolf world young zero'
+).split()
+
+SHOW_STATUSES = ('continuing', 'ended', 'upcoming')
+
+
+def make_title(rng: random.Random) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 3))).title()
+
+
+class MockBackend:
+    """
+    One mock *arr instance
+
+    ``kind`` is 'series' (Sonarr) or 'movie' (Radarr). Each request waits
+    a normally distributed ``latency`` (seconds, sd ``jitter``), then fails
+    with HTTP 503 with probability ``failure_rate``.
+    """
+
+    def __init__(self, kind: str, catalog_size: int, library_size: int, latency: float = 0.0,
+                 jitter: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        self.kind = kind
+        self.external_key = 'tvdbId' if kind == 'series' else 'tmdbId'
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+
+        self.catalog: Dict[int, Dict] = {}
+        self.words: Dict[str, List[int]] = {}
+        for external_id in range(1, catalog_size + 1):
+            record = self._make_record(external_id)
+            self.catalog[external_id] = record
+            for word in record['title'].lower().split():
+                self.words.setdefault(word, []).append(external_id)
+
+        self.library: Dict[int, Dict] = {}
+        for external_id in range(1, min(library_size, catalog_size) + 1):
+            self._add_to_library(self.catalog[external_id])
+        self._library_body: Optional[bytes] = None
+        self._posters: Dict[int, bytes] = {}
+
+    def _make_record(self, external_id: int) -> Dict:
+        record = {
+            'title': make_title(self.rng),
+            'year': self.rng.randint(1970, 2026),
+            self.external_key: external_id,
+            'titleSlug': f'{self.kind}-{external_id}',
+            'overview': 'Generated for benchmarking.',
+            'images': []
+        }
+        if self.kind == 'series':
+            record['status'] = self.rng.choice(SHOW_STATUSES)
+            record['seasons'] = [{'seasonNumber': n, 'monitored': True} for n in range(1, 4)]
+        else:
+            record['hasFile'] = self.rng.random() < 0.7
+            record['isAvailable'] = self.rng.random() < 0.9
+        return record
+
+    def _add_to_library(self, record: Dict) -> Dict:
+        added = dict(record, id=len(self.library) + 1, monitored=True)
+        self.library[record[self.external_key]] = added
+        self._library_body = None
+        return added
+
+    def lookup(self, term: str) -> List[Dict]:
+        term = term.strip().lower()
+        if term.startswith(('tvdb:', 'tmdb:')):
+            record = self.catalog.get(int(term.split(':', 1)[1]))
+            return [record] if record else []
+        matches = None
+        for word in term.split():
+            ids = set(self.words.get(word, ()))
+            matches = ids if matches is None else matches & ids
+        return [self.catalog[external_id] for external_id in sorted(matches or ())[:20]]
+
+    @web.middleware
+    async def inject(self, request: web.Request, handler):
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.rng.gauss(self.latency, self.jitter)))
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            return web.Response(status=503, text='Injected failure')
+        return await handler(request)
+
+    async def library_list(self, request: web.Request) -> web.Response:
+        # Serialized once per change: the mock should not be the bottleneck of a 10k sync
+        if self._library_body is None:
+            self._library_body = json.dumps(list(self.library.values())).encode()
+        return web.Response(body=self._library_body, content_type='application/json')
+
+    def with_poster(self, record: Dict, request: web.Request) -> Dict:
+        """Point the record's poster at this server, as Sonarr/Radarr point at TVDB/TMDB"""
+        poster_url = f'http://{request.host}/posters/{record[self.external_key]}.jpg'
+        return dict(record, images=[{'coverType': 'poster', 'remoteUrl': poster_url}])
+
+    async def lookup_route(self, request: web.Request) -> web.Response:
+        return web.json_response([
+            self.with_poster(record, request) for record in self.lookup(request.query.get('term', ''))
+        ])
+
+    async def lookup_tmdb(self, request: web.Request) -> web.Response:
+        record = self.catalog.get(int(request.query.get('tmdbId', 0)))
+        if record is None:
+            return web.Response(status=404)
+        return web.json_response(self.with_poster(record, request))
+
+    async def poster(self, request: web.Request) -> web.Response:
+        """A full-size poster in a colour derived from the title's ID"""
+        external_id = int(request.match_info['external_id'])
+        body = self._posters.get(external_id)
+        if body is None:
+            colour = ((external_id * 37) % 256, (external_id * 91) % 256, (external_id * 53) % 256)
+            output = io.BytesIO()
+            Image.new('RGB', (680, 1000), colour).save(output, 'JPEG')
+            body = self._posters[external_id] = output.getvalue()
+        return web.Response(body=body, content_type='image/jpeg')
+
+    async def add(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        external_id = payload.get(self.external_key)
+        if external_id in self.library:
+            return web.json_response([{'errorMessage': 'This title has already been added'}], status=400)
+        record = self.catalog.get(external_id)
+        if record is None:
+            return web.Response(status=404)
+        return web.json_response(self._add_to_library(record), status=201)
+
+    async def queue(self, request: web.Request) -> web.Response:
+        """A few library titles mid-download; Sonarr records carry one episode each"""
+        records = []
+        for external_id in list(self.library)[:int(request.query.get('pageSize', 20)) // 10]:
+            size = 4_000_000_000
+            record = {
+                'id': external_id, 'downloadId': f'dl{external_id}', 'size': size,
+                'sizeleft': self.rng.randint(0, size), 'timeleft': f'00:{self.rng.randint(0, 59):02d}:00',
+                'status': 'downloading', 'trackedDownloadState': 'downloading'
+            }
+            if self.kind == 'series':
+                record['series'] = self.library[external_id]
+                record['episode'] = {'seasonNumber': 1, 'episodeNumber': 1, 'title': 'Pilot'}
+            else:
+                record['movie'] = self.library[external_id]
+            records.append(record)
+        return web.json_response({'page': 1, 'totalRecords': len(records), 'records': records})
+
+    async def calendar(self, request: web.Request) -> web.Response:
+        now = datetime.now(timezone.utc)
+        items = []
+        for offset, record in enumerate(list(self.library.values())[:30]):
+            when = (now + timedelta(hours=5 * offset)).isoformat().replace('+00:00', 'Z')
+            if self.kind == 'series':
+                items.append({
+                    'seasonNumber': 2, 'episodeNumber': offset + 1, 'title': f'Episode {offset + 1}',
+                    'airDateUtc': when, 'hasFile': False, 'series': record
+                })
+            else:
+                items.append(dict(record, hasFile=False, digitalRelease=when))
+        return web.json_response(items)
+
+    async def wanted_missing(self, request: web.Request) -> web.Response:
+        """Two aired episodes without a file for every fifth series in the library"""
+        page, page_size = int(request.query.get('page', 1)), int(request.query.get('pageSize', 10))
+        now = datetime.now(timezone.utc)
+        missing = [
+            {
+                'id': series['id'] * 100 + number, 'seriesId': series['id'], 'seasonNumber': 1,
+                'episodeNumber': number, 'hasFile': False, 'monitored': True,
+                'airDateUtc': (now - timedelta(days=series['id'] % 365 + number)).isoformat().replace('+00:00', 'Z')
+            }
+            for series in self.library.values() if series['id'] % 5 == 0
+            for number in (1, 2)
+        ]
+        records = missing[(page - 1) * page_size:page * page_size]
+        return web.json_response({
+            'page': page, 'pageSize': page_size, 'totalRecords': len(missing), 'records': records
+        })
+
+    async def root_folders(self, request: web.Request) -> web.Response:
+        return web.json_response([{'id': 1, 'path': f'/data/{self.kind}'}])
+
+    async def quality_profiles(self, request: web.Request) -> web.Response:
+        return web.json_response([{'id': 1, 'name': 'Any'}])
+
+    async def command(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        return web.json_response(dict(payload, id=self.rng.randint(1, 1_000_000), status='queued'), status=201)
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.inject])
+        app.router.add_get(f'/api/v3/{self.kind}', self.library_list)
+        app.router.add_get(f'/api/v3/{self.kind}/lookup', self.lookup_route)
+        app.router.add_post(f'/api/v3/{self.kind}', self.add)
+        app.router.add_get('/api/v3/rootfolder', self.root_folders)
+        app.router.add_get('/api/v3/qualityprofile', self.quality_profiles)
+        app.router.add_post('/api/v3/command', self.command)
+        app.router.add_get('/api/v3/queue', self.queue)
+        app.router.add_get('/api/v3/calendar', self.calendar)
+        app.router.add_get('/posters/{external_id}.jpg', self.poster)
+        if self.kind == 'movie':
+            app.router.add_get('/api/v3/movie/lookup/tmdb', self.lookup_tmdb)
+        else:
+            app.router.add_get('/api/v3/wanted/missing', self.wanted_missing)
+        return app
+
+
+async def serve(backends: Dict[int, MockBackend], host: str = '127.0.0.1', ready=None):
+    """Serve each backend on its port until cancelled; sets ``ready`` once listening"""
+    runners = []
+    try:
+        for port, backend in backends.items():
+            runner = web.AppRunner(backend.create_app(), access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, host, port).start()
+            runners.append(runner)
+        if ready is not None:
+            ready.set()
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+def run_mock_servers(sonarr_port: int, radarr_port: int, shows: int, movies: int, options: Dict, ready=None):
+    """Process entry point: ``options`` holds the remaining MockBackend keyword arguments"""
+    seed = options.pop('seed', 0)
+    backends = {
+        sonarr_port: MockBackend('series', library_size=shows, seed=seed, **options),
+        radarr_port: MockBackend('movie', library_size=movies, seed=seed + 1, **options)
+    }
+    try:
+        asyncio.run(serve(backends, ready=ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run mock Sonarr and Radarr servers')
+    parser.add_argument('--sonarr-port', type=int, default=8989)
+    parser.add_argument('--radarr-port', type=int, default=7878)
+    parser.add_argument('--shows', type=int, default=10000, help='Shows in the library')
+    parser.add_argument('--movies', type=int, default=10000, help='Movies in the library')
+    parser.add_argument('--catalog-size', type=int, default=20000, help='Titles findable by lookup')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean response latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Latency standard deviation in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of requests answered 503')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    options = {key: getattr(args, key) for key in ('catalog_size', 'latency', 'jitter', 'failure_rate', 'seed')}
+    print(f'Mock Sonarr on :{args.sonarr_port}, mock Radarr on :{args.radarr_port}')
+    run_mock_servers(args.sonarr_port, args.radarr_port, args.shows, args.movies, options)
+
+
+if __name__ == '__main__':
+    main()
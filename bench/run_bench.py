@@ -0,0 +1,331 @@
+"""
+Replay-style load test for the ZulianTV bot
+
+Starts mock Sonarr/Radarr servers in a child process, builds the real
+Application from bot.py with an offline Bot API backend, lets the library
+index sync, then has concurrent virtual users send a weighted mix of
+commands, searches, button presses and library pages. Reports p50/p95/p99
+latency per command, throughput and memory use.
+
+    python bench/run_bench.py --users 50 --requests 40 --shows 10000 --movies 10000 \\
+        --latency 0.05 --jitter 0.02 --failure-rate 0.01
+
+Any bot setting (UPDATE_CONCURRENCY, USER_RATE_LIMIT, HEDGE_DELAY, ...)
+can be overridden through the environment as usual.
+"""
+import argparse
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import random
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Dict, List, Optional
+from telegram import Update
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), 'bot'))
+
+from fake_telegram import FakeTelegramRequest, current_command  # noqa: E402
+from mock_arr import WORDS, run_mock_servers  # noqa: E402
+
+DEFAULT_MIX = (
+    'searchshow=3,searchmovie=3,text=4,myshows=2,mymovies=2,page=2,'
+    'addshow=1,addmovie=1,myrequests=1,queue=1,upcoming=1,inline=2'
+)
+
+KEYSTROKE_INTERVAL = 0.1  # Seconds between the inline queries of a user typing
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = int(weight or 1)
+    unknown = set(mix) - set(ACTIONS)
+    if unknown:
+        raise SystemExit(f"Unknown actions in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class UpdateFactory:
+    """Builds synthetic Telegram updates as the Bot API would deliver them"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.next_id = 0
+
+    def _ids(self) -> int:
+        self.next_id += 1
+        return self.next_id
+
+    @staticmethod
+    def _user(user_id: int) -> Dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f'bench{user_id}'}
+
+    def message(self, user_id: int, text: str):
+        message = {
+            'message_id': self._ids(),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            'text': text
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return Update.de_json({'update_id': self._ids(), 'message': message}, self.bot)
+
+    def callback(self, user_id: int, data: str):
+        update_id = self._ids()
+        query = {
+            'id': str(update_id),
+            'from': self._user(user_id),
+            'chat_instance': 'bench',
+            'data': data,
+            'message': {
+                'message_id': self._ids(),
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': {'id': 1, 'is_bot': True, 'first_name': 'ZulianTV Bench'},
+                'text': 'Select a title:'
+            }
+        }
+        return Update.de_json({'update_id': update_id, 'callback_query': query}, self.bot)
+
+    def typing(self, user_id: int, text: str) -> List:
+        """The inline queries Telegram sends while a user types '@bot <text>', one per keystroke"""
+        return [
+            Update.de_json({'update_id': self._ids(), 'inline_query': {
+                'id': str(self.next_id), 'from': self._user(user_id), 'query': text[:end], 'offset': ''
+            }}, self.bot)
+            for end in range(1, len(text) + 1)
+        ]
+
+
+def random_query(rng: random.Random) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 2)))
+
+
+# Each action builds the update a user would send: (update factory, rng, user ID, state) -> Update
+ACTIONS = {
+    'searchshow': lambda f, rng, user, s: f.message(user, f'/searchshow {random_query(rng)}'),
+    'searchmovie': lambda f, rng, user, s: f.message(user, f'/searchmovie {random_query(rng)}'),
+    'text': lambda f, rng, user, s: f.message(user, random_query(rng)),
+    'myshows': lambda f, rng, user, s: f.message(user, rng.choice(('/myshows', '/myshows continuing'))),
+    'mymovies': lambda f, rng, user, s: f.message(user, rng.choice(('/mymovies', '/mymovies missing'))),
+    'page': lambda f, rng, user, s: f.callback(
+        user, f"lib_{rng.choice(('shows', 'movies'))}_all_n_{rng.randint(1, s['library_rows'])}"
+    ),
+    'addshow': lambda f, rng, user, s: f.callback(user, s['add_button'](user, 'show')),
+    'addmovie': lambda f, rng, user, s: f.callback(user, s['add_button'](user, 'movie')),
+    'myrequests': lambda f, rng, user, s: f.message(user, '/myrequests'),
+    'queue': lambda f, rng, user, s: f.message(user, rng.choice(('/queue', '/queue mine'))),
+    'upcoming': lambda f, rng, user, s: f.message(user, '/upcoming'),
+    'inline': lambda f, rng, user, s: f.typing(user, random_query(rng)),
+}
+
+
+async def virtual_user(application, factory: UpdateFactory, user_id: int, requests: int, mix: Dict[str, int],
+                       think: float, state: Dict, samples: Dict[str, List[float]], rng: random.Random):
+    names, weights = list(mix), list(mix.values())
+    processor = application.update_processor
+    for _ in range(requests):
+        if think:
+            await asyncio.sleep(rng.expovariate(1 / think))
+        action = rng.choices(names, weights)[0]
+        updates = ACTIONS[action](factory, rng, user_id, state)
+        token = current_command.set(action)
+        started = time.perf_counter()
+        try:
+            if isinstance(updates, list):
+                # Keystrokes: each query is handled as it arrives, timed from the last one
+                handling = []
+                for update in updates:
+                    if handling:
+                        await asyncio.sleep(KEYSTROKE_INTERVAL)
+                    handling.append(asyncio.ensure_future(
+                        processor.process_update(update, application.process_update(update))
+                    ))
+                started = time.perf_counter()
+                await asyncio.gather(*handling)
+            else:
+                # Same path as a polled update, including the UPDATE_CONCURRENCY cap
+                await processor.process_update(updates, application.process_update(updates))
+        finally:
+            samples[action].append(time.perf_counter() - started)
+            current_command.reset(token)
+
+
+async def wait_for_library(library, timeout: float) -> float:
+    started = time.perf_counter()
+    while library.synced_at('shows') is None or library.synced_at('movies') is None:
+        if time.perf_counter() - started > timeout:
+            raise SystemExit(f"Library index did not sync within {timeout:.0f}s")
+        await asyncio.sleep(0.05)
+    return time.perf_counter() - started
+
+
+def report(samples: Dict[str, List[float]], errors: Dict[Optional[str], int], elapsed: float,
+           sync_seconds: float, traced_peak: Optional[int], caches: Dict[str, Dict[str, int]]):
+    total = sum(len(values) for values in samples.values())
+    print()
+    print(f"Library sync (cold): {sync_seconds:.2f}s")
+    print(f"Updates: {total} in {elapsed:.2f}s ({total / elapsed:.1f}/s)")
+    print()
+    print(f"{'command':<12} {'count':>6} {'errors':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name in sorted(samples):
+        values = sorted(samples[name])
+        print(
+            f"{name:<12} {len(values):>6} {errors.get(name, 0):>6} "
+            f"{percentile(values, 0.50) * 1000:>8.1f} {percentile(values, 0.95) * 1000:>8.1f} "
+            f"{percentile(values, 0.99) * 1000:>8.1f} {values[-1] * 1000:>8.1f}"
+        )
+    print()
+    for name, stats in caches.items():
+        print(f"{name}: " + ", ".join(f"{key} {value}" for key, value in stats.items()))
+    print()
+    # ru_maxrss is reported in KiB on Linux
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+    if traced_peak is not None:
+        print(f"Peak traced Python allocations: {traced_peak / 2**20:.1f} MiB")
+
+
+async def run(args):
+    import bot as zuliantv
+    logging.getLogger().setLevel(args.log_level)
+
+    telegram = FakeTelegramRequest(args.telegram_latency)
+    library_size = {'show': args.shows, 'movie': args.movies}
+    # Catalog titles past the library size are not in the library yet, so these adds are new
+    unadded = {
+        kind: iter(range(size + 1, args.catalog_size + 1)) for kind, size in library_size.items()
+    }
+    pressed = set()
+
+    def add_button(user_id: int, kind: str) -> str:
+        """Press a not yet added result button from the user's last search, else add by ID"""
+        for data in telegram.buttons.get(user_id, ()):
+            if data.startswith(f'add_{kind}_') and data not in pressed \
+                    and int(data.split('_')[2]) > library_size[kind]:
+                pressed.add(data)
+                return data
+        return f'add_{kind}_{next(unadded[kind], 1)}'
+
+    state = {'library_rows': max(1, min(args.shows, args.movies)), 'add_button': add_button}
+
+    application = zuliantv.build_application(request=telegram)
+    await application.initialize()
+    await zuliantv.start_background_tasks(application)
+    try:
+        sync_seconds = await wait_for_library(zuliantv.library, args.sync_timeout)
+
+        if args.trace_memory:
+            tracemalloc.start()
+        factory = UpdateFactory(application.bot)
+        samples: Dict[str, List[float]] = defaultdict(list)
+        mix = parse_mix(args.mix)
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            virtual_user(application, factory, user_id, args.requests, mix, args.think, state, samples,
+                         random.Random(args.seed * 1000 + user_id))
+            for user_id in range(1, args.users + 1)
+        ))
+        elapsed = time.perf_counter() - started
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+        caches = {
+            'Sonarr lookup cache': zuliantv.sonarr.default.lookup_cache.stats(),
+            'Radarr lookup cache': zuliantv.radarr.default.lookup_cache.stats(),
+            'Presented results': zuliantv.presented.stats(),
+            'Inline search': dict(zuliantv.inline_search.stats(), answers=telegram.calls['answerInlineQuery']),
+        }
+        if zuliantv.missing_search is not None:
+            caches['Missing search'] = zuliantv.missing_search.stats()
+        if zuliantv.posters is not None:
+            caches['Poster cache'] = dict(zuliantv.posters.stats(), uploaded_bytes=telegram.upload_bytes)
+    finally:
+        await zuliantv.stop_background_tasks(application)
+        await application.shutdown()
+
+    report(samples, telegram.error_replies, elapsed, sync_seconds, traced_peak, caches)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the bot against mock Sonarr/Radarr servers')
+    parser.add_argument('--users', type=int, default=20, help='Concurrent virtual users')
+    parser.add_argument('--requests', type=int, default=25, help='Updates sent by each user')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Weighted actions (default: {DEFAULT_MIX})')
+    parser.add_argument('--think', type=float, default=0.0, help="Mean pause between a user's updates, seconds")
+    parser.add_argument('--shows', type=int, default=10000, help='Shows in the mock library')
+    parser.add_argument('--movies', type=int, default=10000, help='Movies in the mock library')
+    parser.add_argument('--catalog-size', type=int, default=20000, help='Titles findable by lookup')
+    parser.add_argument('--latency', type=float, default=0.02, help='Mean mock Sonarr/Radarr latency, seconds')
+    parser.add_argument('--jitter', type=float, default=0.01, help='Mock latency standard deviation, seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='Fraction of mock requests failing with 503')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help='Simulated Bot API latency, seconds')
+    parser.add_argument('--sync-timeout', type=float, default=120.0)
+    parser.add_argument('--trace-memory', action='store_true', help='Also report traced allocations (slower)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING', help='Bot log level while the benchmark runs')
+    args = parser.parse_args()
+    args.catalog_size = max(args.catalog_size, args.shows, args.movies)
+
+    sonarr_port, radarr_port, http_port = free_port(), free_port(), free_port()
+    options = {key: getattr(args, key) for key in ('catalog_size', 'latency', 'jitter', 'failure_rate', 'seed')}
+    ready = multiprocessing.Event()
+    mock = multiprocessing.Process(
+        target=run_mock_servers, args=(sonarr_port, radarr_port, args.shows, args.movies, options, ready),
+        daemon=True
+    )
+    mock.start()
+    if not ready.wait(60):
+        raise SystemExit("Mock servers did not start")
+
+    data_dir = tempfile.mkdtemp(prefix='zuliantv-bench-')
+    # config.py reads the environment at import time, so this must precede importing bot
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:bench',
+        'SONARR_URL': f'http://127.0.0.1:{sonarr_port}',
+        'SONARR_API_KEY': 'bench',
+        'RADARR_URL': f'http://127.0.0.1:{radarr_port}',
+        'RADARR_API_KEY': 'bench',
+        'ALLOWED_USERS': ','.join(str(user_id) for user_id in range(1, args.users + 1)),
+        'DATA_DIR': data_dir,
+        'HTTP_LISTEN_HOST': '127.0.0.1',
+        'HTTP_LISTEN_PORT': str(http_port),
+    })
+    # Measure the bot rather than the per-user throttle unless asked to
+    os.environ.setdefault('USER_RATE_LIMIT', '1000')
+    os.environ.setdefault('USER_RATE_BURST', '1000')
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        mock.terminate()
+        mock.join()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
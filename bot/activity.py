@@ -0,0 +1,252 @@
+"""
+Shared snapshot of the Sonarr/Radarr download queues and calendars
+
+/queue and /upcoming read from one in-memory snapshot that a background
+task refreshes with a single batch of requests per interval (a queue and
+a calendar per instance), so the upstream cost does not grow with the
+number of users asking.
+"""
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Records fetched per queue request; larger queues are cut off
+QUEUE_PAGE_SIZE = 200
+
+# Radarr release dates shown by /upcoming
+MOVIE_RELEASES = (('inCinemas', 'in cinemas'), ('digitalRelease', 'digital'), ('physicalRelease', 'physical'))
+
+IMPORT_STATES = ('importPending', 'importing', 'imported')
+
+
+class QueueEntry(NamedTuple):
+    kind: str  # 'show' | 'movie'
+    media_id: Optional[int]  # TVDB or TMDB ID
+    title: str
+    detail: str  # episodes for shows, year for movies
+    progress: float  # 0..1
+    time_left: Optional[int]  # seconds
+    status: str
+    instance: str = 'default'
+
+
+class UpcomingEntry(NamedTuple):
+    when: datetime
+    kind: str
+    media_id: Optional[int]
+    title: str
+    detail: str
+
+
+def parse_timeleft(value: Optional[str]) -> Optional[int]:
+    """Seconds from a .NET TimeSpan string: 'hh:mm:ss' or 'd.hh:mm:ss'"""
+    if not value:
+        return None
+    try:
+        days = 0
+        if '.' in value.split(':')[0]:
+            day_part, value = value.split('.', 1)
+            days = int(day_part)
+        hours, minutes, seconds = value.split(':')
+        return days * 86400 + int(hours) * 3600 + int(minutes) * 60 + int(float(seconds))
+    except ValueError:
+        return None
+
+
+def format_duration(seconds: int) -> str:
+    if seconds < 60:
+        return "<1m"
+    minutes = seconds // 60
+    if minutes < 60:
+        return f"{minutes}m"
+    hours, minutes = divmod(minutes, 60)
+    if hours < 24:
+        return f"{hours}h {minutes}m" if minutes else f"{hours}h"
+    days, hours = divmod(hours, 24)
+    return f"{days}d {hours}h" if hours else f"{days}d"
+
+
+def progress_bar(fraction: float, width: int = 10) -> str:
+    filled = min(width, max(0, round(fraction * width)))
+    return "▓" * filled + "░" * (width - filled)
+
+
+def parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        when = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return when if when.tzinfo else when.replace(tzinfo=timezone.utc)
+
+
+def _status(record: Dict) -> str:
+    if record.get('trackedDownloadState') in IMPORT_STATES:
+        return 'importing'
+    if record.get('trackedDownloadStatus') == 'warning':
+        return 'stalled'
+    return (record.get('status') or 'queued').lower()
+
+
+def _progress(record: Dict) -> float:
+    size = record.get('size') or 0
+    if not size:
+        return 0.0
+    return max(0.0, min(1.0, (size - (record.get('sizeleft') or 0)) / size))
+
+
+def episode_label(episodes: List[Dict]) -> str:
+    """'S01E05 · Title' for one episode, 'S01E01-S01E10 (10 episodes)' for a pack"""
+    codes = sorted(
+        (episode.get('seasonNumber', 0), episode.get('episodeNumber', 0), episode.get('title') or '')
+        for episode in episodes
+    )
+    if not codes:
+        return ''
+    first = f"S{codes[0][0]:02d}E{codes[0][1]:02d}"
+    if len(codes) == 1:
+        return f"{first} · {codes[0][2]}" if codes[0][2] else first
+    last = f"S{codes[-1][0]:02d}E{codes[-1][1]:02d}"
+    return f"{first}-{last} ({len(codes)} episodes)"
+
+
+def parse_sonarr_queue(page: Dict, instance: str = 'default') -> List[QueueEntry]:
+    """One entry per download: a season pack's episode records are grouped together"""
+    downloads: Dict[str, List[Dict]] = {}
+    for record in page.get('records', []):
+        downloads.setdefault(record.get('downloadId') or str(record.get('id')), []).append(record)
+
+    entries = []
+    for records in downloads.values():
+        record = records[0]
+        series = record.get('series') or {}
+        entries.append(QueueEntry(
+            'show', series.get('tvdbId'), series.get('title') or record.get('title', 'Unknown'),
+            episode_label([r['episode'] for r in records if r.get('episode')]),
+            _progress(record), parse_timeleft(record.get('timeleft')), _status(record), instance
+        ))
+    return entries
+
+
+def parse_radarr_queue(page: Dict, instance: str = 'default') -> List[QueueEntry]:
+    entries = []
+    for record in page.get('records', []):
+        movie = record.get('movie') or {}
+        entries.append(QueueEntry(
+            'movie', movie.get('tmdbId'), movie.get('title') or record.get('title', 'Unknown'),
+            str(movie.get('year') or ''), _progress(record), parse_timeleft(record.get('timeleft')),
+            _status(record), instance
+        ))
+    return entries
+
+
+def parse_sonarr_calendar(episodes: List[Dict]) -> List[UpcomingEntry]:
+    entries = []
+    for episode in episodes:
+        when = parse_time(episode.get('airDateUtc'))
+        if when is None or episode.get('hasFile'):
+            continue
+        series = episode.get('series') or {}
+        entries.append(UpcomingEntry(
+            when, 'show', series.get('tvdbId'), series.get('title', 'Unknown'), episode_label([episode])
+        ))
+    return entries
+
+
+def parse_radarr_calendar(movies: List[Dict], start: datetime, end: datetime) -> List[UpcomingEntry]:
+    """Radarr returns a movie if any of its release dates is in range; keep only those dates"""
+    entries = []
+    for movie in movies:
+        if movie.get('hasFile'):
+            continue
+        for field, label in MOVIE_RELEASES:
+            when = parse_time(movie.get(field))
+            if when is not None and start <= when < end:
+                entries.append(UpcomingEntry(when, 'movie', movie.get('tmdbId'), movie.get('title', 'Unknown'), label))
+    return entries
+
+
+class ActivitySnapshot:
+    """
+    Download queues and upcoming releases of every backend instance
+
+    refresh() fetches all queues and calendars concurrently. A part that
+    fails keeps its previous contents, so one instance being down does
+    not blank the others' entries.
+    """
+
+    def __init__(self, sonarr, radarr, upcoming_days: int = 7):
+        self.sonarr = sonarr
+        self.radarr = radarr
+        self.upcoming_days = upcoming_days
+        self.queue: List[QueueEntry] = []
+        self.upcoming: List[UpcomingEntry] = []
+        self.updated_at: Optional[float] = None
+        self._parts: Dict[Tuple[str, str], List] = {}  # (part, backend label) -> entries
+
+    async def refresh(self):
+        now = datetime.now(timezone.utc)
+        # Just-aired episodes stay listed for an hour while they are grabbed
+        since = now - timedelta(hours=1)
+        end = now + timedelta(days=self.upcoming_days)
+        start_date, end_date = since.date().isoformat(), (end.date() + timedelta(days=1)).isoformat()
+        fetches = {}
+        for client in self.sonarr:
+            fetches[('queue', client.backend_label)] = (
+                client.get_queue(QUEUE_PAGE_SIZE),
+                lambda page, instance=client.instance: parse_sonarr_queue(page, instance)
+            )
+            fetches[('calendar', client.backend_label)] = (
+                client.get_calendar(start_date, end_date), parse_sonarr_calendar
+            )
+        for client in self.radarr:
+            fetches[('queue', client.backend_label)] = (
+                client.get_queue(QUEUE_PAGE_SIZE),
+                lambda page, instance=client.instance: parse_radarr_queue(page, instance)
+            )
+            fetches[('calendar', client.backend_label)] = (
+                client.get_calendar(start_date, end_date),
+                lambda movies: parse_radarr_calendar(movies, since, end)
+            )
+        results = await asyncio.gather(*(fetch for fetch, _ in fetches.values()), return_exceptions=True)
+
+        refreshed = 0
+        for (name, (_, parse)), result in zip(fetches.items(), results):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                self._parts[name] = parse(result)
+                refreshed += 1
+            except Exception as e:
+                logger.warning(f"Activity refresh of {name[1]} {name[0]} failed: {e}")
+
+        parts = self._parts
+        self.queue = sorted(
+            (entry for (part, _), entries in parts.items() if part == 'queue' for entry in entries),
+            key=lambda entry: (entry.time_left is None, entry.time_left or 0, entry.title)
+        )
+        # A title tracked by several instances (e.g. 1080p and 4K) airs once.
+        # A calendar part kept from an earlier refresh may list releases that have passed since.
+        upcoming = {
+            (entry.when, entry.kind, entry.media_id, entry.detail): entry
+            for (part, _), entries in parts.items() if part == 'calendar' for entry in entries
+            if since <= entry.when < end
+        }
+        self.upcoming = sorted(upcoming.values(), key=lambda entry: entry.when)
+        if refreshed:
+            self.updated_at = time.time()
+
+    def age(self) -> float:
+        return math.inf if self.updated_at is None else time.time() - self.updated_at
+
+    async def run(self, interval: float):
+        """Refresh every interval seconds until cancelled"""
+        while True:
+            await self.refresh()
+            await asyncio.sleep(interval)
@@ -0,0 +1,336 @@
+"""
+Shared async HTTP plumbing for the Sonarr/Radarr API clients
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple, TypeVar
+from urllib.parse import quote
+import httpx
+import ijson
+import config
+from cache import AsyncLRUCache, AsyncTTLValue, normalize_query
+from metrics import UPSTREAM_ERRORS, UPSTREAM_IN_FLIGHT, UPSTREAM_LATENCY, endpoint_label
+from rate_limit import BulkJob, FairLimiter, UserRateLimiter, current_user
+from resilience import BackendUnreachable, CircuitBreaker
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Shared by every backend: a user's budget covers Sonarr and Radarr together
+user_limiter = UserRateLimiter(config.USER_RATE_LIMIT, config.USER_RATE_BURST)
+# Bulk imports (/addlist) get a separate, larger budget per user
+bulk_limiter = UserRateLimiter(config.BULK_ADD_RATE_LIMIT, config.BULK_ADD_RATE_BURST)
+
+
+# Validation errors on these fields mean the cached defaults are out of date
+DEFAULTS_PROPERTIES = {'rootfolderpath', 'qualityprofileid'}
+
+
+def is_transient(error: httpx.HTTPError) -> bool:
+    """Timeouts, connection failures and 5xx mean the backend is struggling, not the request"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+class UpstreamError(Exception):
+    """A request the backend rejected (4xx), with its status code and response body"""
+
+    def __init__(self, message: str, status_code: int, body: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+    def rejects_defaults(self) -> bool:
+        """
+        True if the backend refused the root folder or quality profile of an add
+
+        Sonarr/Radarr answer failed validation with a 400 and a list of
+        {propertyName, errorMessage}; other rejections (e.g. the title is
+        already in the library) say nothing about the cached defaults.
+        """
+        if self.status_code != 400:
+            return False
+        try:
+            errors = json.loads(self.body)
+        except ValueError:
+            errors = None
+        if isinstance(errors, list):
+            properties = {
+                str(error.get('propertyName', '')).casefold() for error in errors if isinstance(error, dict)
+            }
+            return bool(properties & DEFAULTS_PROPERTIES)
+        body = self.body.casefold()
+        return any(name in body for name in DEFAULTS_PROPERTIES)
+
+
+class AsyncArrClient:
+    """
+    Mixin that swaps the blocking _make_request for an awaitable one
+
+    Mixed in ahead of SonarrAPI/RadarrAPI, so every method that simply
+    returns self._make_request(...) becomes awaitable without being
+    rewritten. ``instance`` names the backend instance in a pool (see
+    instances.InstancePool); each instance owns one pooled keep-alive session, a
+    cached copy of the default root folder and quality profile, and an
+    LRU cache in front of the title lookup endpoint. The defaults are
+    snapshotted to DATA_DIR and served stale while they revalidate.
+
+    Upstream calls are charged to the Telegram user being served (see
+    rate_limit.current_user) and share a fair, capped pool of slots.
+    A circuit breaker fails fast while the backend is down, and GETs are
+    retried and optionally hedged to bound tail latency.
+    """
+
+    service_name = 'Arr'
+    max_connections = 20
+
+    def __init__(self, *args, instance: str = 'default', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instance = instance
+        # "Sonarr (4k)" in messages, "sonarr-4k" in metrics and file names
+        if instance == 'default':
+            self.display_name = self.service_name
+            self.backend_label = self.service_name.lower()
+        else:
+            self.display_name = f"{self.service_name} ({instance})"
+            self.backend_label = f"{self.service_name.lower()}-{instance}"
+        self._client: Optional[httpx.AsyncClient] = None
+        self._defaults = AsyncTTLValue(
+            self._load_defaults, config.DEFAULTS_CACHE_TTL,
+            max_stale=config.DEFAULTS_MAX_STALE,
+            snapshot_path=os.path.join(config.DATA_DIR, f'{self.backend_label}_defaults.json')
+        )
+        self.lookup_cache = AsyncLRUCache(config.LOOKUP_CACHE_SIZE, config.LOOKUP_CACHE_TTL)
+        self.limiter = FairLimiter(config.UPSTREAM_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(
+            self.display_name, config.BREAKER_FAILURE_THRESHOLD, config.BREAKER_RESET_TIMEOUT
+        )
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Create the pooled HTTP session on first use"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=f"{self.base_url}/api/v3/",
+                headers=self.headers,
+                timeout=config.ARR_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                )
+            )
+        return self._client
+
+    async def _acquire_user_budget(self) -> Optional[Hashable]:
+        """Wait for the current user's rate budget; returns the key the call is queued under"""
+        user_id = current_user.get()
+        if isinstance(user_id, BulkJob):
+            await bulk_limiter.acquire(user_id)
+        elif user_id is not None:
+            await user_limiter.acquire(user_id)
+        return user_id
+
+    async def _send(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
+        """One HTTP attempt, with latency/error metrics"""
+        labels = (self.backend_label, method, endpoint_label(endpoint))
+        in_flight = UPSTREAM_IN_FLIGHT.labels(labels[0])
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            response = await self._get_client().request(method, endpoint, json=data)
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError:
+            UPSTREAM_ERRORS.labels(*labels).inc()
+            raise
+        finally:
+            UPSTREAM_LATENCY.labels(*labels).observe(time.perf_counter() - started)
+            in_flight.dec()
+
+    async def _hedged_get(self, endpoint: str) -> Dict:
+        """
+        GET with an optional hedge
+
+        If the first attempt has not answered after HEDGE_DELAY seconds, a
+        second identical request is sent and whichever succeeds first wins.
+        The hedge needs a free slot of its own; without one it is skipped,
+        as the backend is busy enough already.
+        """
+        if not config.HEDGE_DELAY:
+            return await self._send('GET', endpoint)
+
+        first = asyncio.create_task(self._send('GET', endpoint))
+        pending = {first}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=config.HEDGE_DELAY)
+            if done:
+                return first.result()
+
+            if not self.limiter.try_acquire():
+                return await first
+            hedge = asyncio.create_task(self._send('GET', endpoint))
+            hedge.add_done_callback(lambda _: self.limiter.release())
+            pending.add(hedge)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _get_with_retries(self, endpoint: str) -> Dict:
+        """
+        Idempotent GET, retried on transient errors with jittered exponential backoff
+
+        Every failed attempt counts toward the circuit breaker, and retries
+        stop as soon as it opens.
+        """
+        for attempt in range(config.GET_RETRIES + 1):
+            try:
+                return await self._hedged_get(endpoint)
+            except httpx.HTTPError as e:
+                if not is_transient(e):
+                    raise
+                self.breaker.record_failure()
+                if attempt == config.GET_RETRIES or self.breaker.is_open:
+                    raise
+                await asyncio.sleep(random.uniform(0, config.RETRY_BACKOFF * 2 ** attempt))
+
+    def _unreachable(self, detail: str) -> BackendUnreachable:
+        """Log a transient failure and build the error shown to the user for it"""
+        logger.warning(f"{self.display_name} API error: {detail}")
+        return BackendUnreachable(self.display_name, detail)
+
+    async def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Dict:
+        """Make an API request without blocking the event loop"""
+        user_id = await self._acquire_user_budget()
+        self.breaker.before_call()
+        try:
+            async with self.limiter.slot(user_id):
+                if method == 'GET':
+                    result = await asyncio.wait_for(self._get_with_retries(endpoint), config.GET_DEADLINE)
+                else:
+                    result = await self._send(method, endpoint, data)
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            raise self._unreachable(f"no response within {config.GET_DEADLINE:g}s")
+        except httpx.HTTPError as e:
+            if not is_transient(e):
+                self.breaker.record_success()
+                if isinstance(e, httpx.HTTPStatusError):
+                    raise UpstreamError(
+                        f"{self.display_name} API error: {str(e)}", e.response.status_code, e.response.text
+                    )
+                raise Exception(f"{self.display_name} API error: {str(e)}")
+            if method != 'GET':
+                # Failed GET attempts were already counted by _get_with_retries
+                self.breaker.record_failure()
+            raise self._unreachable(str(e))
+        self.breaker.record_success()
+        return result
+
+    async def _stream_list(self, endpoint: str, project: Callable[[Dict], T]) -> AsyncIterator[T]:
+        """
+        Stream a JSON array endpoint, yielding project(item) for each element
+
+        The body is parsed incrementally as chunks arrive, so only one raw
+        item is alive at a time and callers keep just the projected record.
+        Used for the full-library listings, which can be several MB.
+        """
+        items = ijson.sendable_list()
+        parser = ijson.items_coro(items, 'item', use_float=True)
+        user_id = await self._acquire_user_budget()
+        self.breaker.before_call()
+        labels = (self.backend_label, 'GET', endpoint_label(endpoint))
+        in_flight = UPSTREAM_IN_FLIGHT.labels(labels[0])
+        try:
+            async with self.limiter.slot(user_id):
+                in_flight.inc()
+                started = time.perf_counter()
+                try:
+                    async with self._get_client().stream('GET', endpoint) as response:
+                        response.raise_for_status()
+                        async for chunk in response.aiter_bytes():
+                            parser.send(chunk)
+                            for item in items:
+                                yield project(item)
+                            del items[:]
+                finally:
+                    UPSTREAM_LATENCY.labels(*labels).observe(time.perf_counter() - started)
+                    in_flight.dec()
+            parser.close()
+            self.breaker.record_success()
+            for item in items:
+                yield project(item)
+        except httpx.HTTPError as e:
+            UPSTREAM_ERRORS.labels(*labels).inc()
+            if is_transient(e):
+                self.breaker.record_failure()
+                raise self._unreachable(str(e))
+            raise Exception(f"{self.display_name} API error: {str(e)}")
+        except ijson.JSONError as e:
+            UPSTREAM_ERRORS.labels(*labels).inc()
+            raise Exception(f"{self.display_name} API error: invalid JSON in {endpoint}: {str(e)}")
+
+    async def _cached_lookup(self, endpoint: str, query: str) -> List[Dict]:
+        """
+        Run a title lookup through the LRU cache
+
+        Queries are normalized first, so "Breaking Bad" and "breaking  bad"
+        share an entry, and simultaneous identical searches hit upstream once.
+        """
+        term = normalize_query(query)
+        return await self.lookup_cache.get_or_load(
+            term,
+            lambda: self._make_request('GET', f'{endpoint}?term={quote(term)}')
+        )
+
+    async def _load_defaults(self) -> Tuple[str, int]:
+        """Fetch root folders and quality profiles concurrently"""
+        root_folders, quality_profiles = await asyncio.gather(
+            self.get_root_folders(),
+            self.get_quality_profiles()
+        )
+
+        if not root_folders or not quality_profiles:
+            raise Exception(f"No root folders or quality profiles configured in {self.display_name}")
+
+        return root_folders[0]['path'], quality_profiles[0]['id']
+
+    async def get_defaults(self) -> Tuple[str, int]:
+        """Get the default (root folder path, quality profile ID), served from cache"""
+        # The on-disk snapshot round-trips through JSON, which turns the tuple into a list
+        return tuple(await self._defaults.get())
+
+    async def refresh_defaults(self) -> Tuple[str, int]:
+        """Reload the defaults now, keeping the cached copy if the backend is unreachable"""
+        return tuple(await self._defaults.refresh())
+
+    async def run_defaults_refresh(self, interval: float):
+        """Warm the defaults at startup and reload them every interval seconds until cancelled"""
+        while True:
+            try:
+                await self.refresh_defaults()
+            except Exception as e:
+                logger.warning(f"Could not refresh {self.display_name} defaults: {e}")
+            await asyncio.sleep(interval)
+
+    def invalidate_defaults(self):
+        """Forget the cached defaults, e.g. after an add was rejected because of them"""
+        self._defaults.invalidate()
+
+    async def close(self):
+        """Close the pooled HTTP session"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
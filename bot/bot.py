@@ -2,19 +2,46 @@
 ZulianTV Telegram Bot - Main Bot Logic
 Allows users to request TV shows and movies via Telegram
 """
+import asyncio
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import time
+from telegram import (
+    Update,
+    InlineKeyboardButton,
+    InlineKeyboardMarkup,
+    InlineQueryResultArticle,
+    InputMediaPhoto,
+    InputTextMessageContent
+)
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
     ContextTypes,
+    InlineQueryHandler,
+    TypeHandler,
     filters
 )
 import config
-from sonarr_api import SonarrAPI
-from radarr_api import RadarrAPI
+from sonarr_api import AsyncSonarrAPI
+from radarr_api import AsyncRadarrAPI
+from rate_limit import BulkJob, FairUpdateProcessor, current_user
+from resilience import BackendUnavailable
+from title_index import TitleIndex, similarity
+from bulk_add import ADDED, EXISTS, FAILED, NOT_FOUND, BulkAdder, parse_entries
+from metrics import InstrumentedRequest, instrument_handler, register_stats
+from library_index import FILTERS as library_filters, LibraryIndex
+from notifications import DownloadNotifier
+from request_store import DOWNLOADED, DOWNLOADING, RequestStore
+from web_server import create_web_app, start_web_server
+from activity import ActivitySnapshot, format_duration, progress_bar
+from cache import PresentedResults, normalize_query
+from instances import InstancePool
+from posters import PosterCache, poster_url
+from inline_search import InlineSearch
+from missing_search import MissingSearch
 
 # Setup logging
 logging.basicConfig(
@@ -23,9 +50,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize API clients
-sonarr = SonarrAPI()
-radarr = RadarrAPI()
+# Initialize API clients: a pool of named instances per service, one pooled HTTP session each
+sonarr = InstancePool.from_config(AsyncSonarrAPI, config.SONARR_INSTANCES)
+radarr = InstancePool.from_config(AsyncRadarrAPI, config.RADARR_INSTANCES)
+
+# Local library index, kept in sync by a background task
+library = LibraryIndex(config.LIBRARY_INDEX_PATH)
+
+# Fuzzy title lookups over the library, fed by the library index
+titles = TitleIndex()
+library.add_listener(titles.library_changed)
+
+# A local match at least this close skips the upstream lookup in handle_text
+EXACT_MATCH_SCORE = 0.9
+# ...and at least this close picks the backend to search; weaker ones leave it to the combined search
+KIND_HINT_SCORE = 0.7
+
+# Lookup records behind result buttons, so pressing one skips the re-lookup
+presented = PresentedResults(config.PRESENTED_RESULTS_SIZE, config.PRESENTED_RESULTS_TTL)
+
+# Downscaled poster thumbnails for search results, reused by Telegram file_id once uploaded
+posters = PosterCache(
+    config.POSTER_CACHE_DIR, config.POSTER_CACHE_MAX_MB * 1024 * 1024,
+    config.POSTER_MAX_WIDTH, config.POSTER_MAX_HEIGHT, config.POSTER_FETCH_CONCURRENCY
+) if config.POSTERS_ENABLED else None
+
+# Who requested what, written behind in batches
+requests_store = RequestStore(config.REQUEST_STORE_PATH)
+
+# Resolves and adds /addlist entries with bounded concurrency
+bulk_adder = BulkAdder(sonarr, radarr, library, config.BULK_ADD_CONCURRENCY)
+
+# Routes Sonarr/Radarr webhook events to requesters; send is bound in post_init
+notifier = DownloadNotifier(requests_store, send=None)
+
+# Download queues and calendars, refreshed for everyone by one background task
+activity = ActivitySnapshot(sonarr, radarr, config.UPCOMING_DAYS)
+
+# Paced re-searches of missing monitored episodes and movies
+missing_search = MissingSearch(
+    config.MISSING_SEARCH_PATH, library, requests_store, sonarr, radarr, activity,
+    config.MISSING_SEARCH_INTERVAL, config.MISSING_SEARCH_PER_HOUR, config.MISSING_SEARCH_BATCH_SIZE,
+    config.MISSING_SEARCH_RETRY_HOURS * 3600, config.MISSING_SEARCH_PRIORITY_DAYS * 86400
+) if config.MISSING_SEARCH_ENABLED else None
 
 
 def is_authorized(user_id: int) -> bool:
@@ -33,6 +100,11 @@ def is_authorized(user_id: int) -> bool:
     return user_id in config.ALLOWED_USERS
 
 
+async def track_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Charge upstream calls made while handling this update to its sender"""
+    current_user.set(update.effective_user.id if update.effective_user else None)
+
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /start is issued."""
     user = update.effective_user
@@ -48,8 +120,12 @@ I can help you add movies and TV shows to your Jellyfin library.
 Available commands:
 /searchshow <name> - Search for a TV show
 /searchmovie <name> - Search for a movie
-/myshows - List your TV shows
-/mymovies - List your movies
+/myshows [continuing|ended|upcoming] - List your TV shows
+/mymovies [missing|downloaded] - List your movies
+/myrequests - See what you requested
+/queue [mine] - Download progress
+/upcoming - Episodes and movies due this week
+/addlist - Add many titles at once, one per line
 /help - Show this help message
 
 Just send me the name of what you want to watch!
@@ -76,18 +152,98 @@ Example: /searchmovie Inception
 
 📋 My Library:
 /myshows - List all your TV shows
+/myshows continuing - Only shows still airing
 /mymovies - List all your movies
+/mymovies missing - Only movies not downloaded yet
+/myrequests - Your requests and their download status
+
+📥 Downloads:
+/queue - What is downloading and how far along it is
+/queue mine - Only the titles you requested
+/upcoming - Episodes and movies due in the coming days
+
+➕ Bulk Add:
+/addlist followed by one title per line
+(or attach a .txt file with /addlist as its caption)
 
 💡 Tips:
 - You can also just type the name of a show/movie
 - I'll help you choose if there are multiple matches
+- In any chat, type @ and my username followed by a title to share it
 - I'll automatically download and organize everything!
 """
+    extra_instances = [name for name in sonarr.names + radarr.names if name != 'default']
+    if extra_instances:
+        example = extra_instances[0]
+        help_text += (
+            f"\n🗂 Instances: {', '.join(dict.fromkeys(extra_instances))}\n"
+            f"Put one first to add there, e.g. /searchmovie {example} Dune\n"
+        )
     await update.message.reply_text(help_text)
 
 
+def split_instance(args: list, pool: InstancePool):
+    """'/searchmovie 4k Dune' -> ('4k', ['Dune']); (None, args) without an instance name"""
+    if len(args) > 1 and args[0].lower() in pool:
+        return args[0].lower(), args[1:]
+    return None, args
+
+
+def add_callback_data(kind: str, media_id: int, token: str, instance: str = None) -> str:
+    callback_data = f"add_{kind}_{media_id}_{token}"
+    return f"{callback_data}_{instance}" if instance else callback_data
+
+
+async def reply_with_posters(message, records: list) -> bool:
+    """
+    Send the posters of search results as one album, numbered like the result buttons
+
+    Posters Telegram already has are sent by file_id; the file_ids of new
+    uploads are remembered. Returns whether any poster was sent. Never
+    raises for Telegram errors: posters are an extra, not part of the reply.
+    """
+    if posters is None:
+        return False
+    found = await posters.get_many([poster_url(record) for record in records], config.POSTER_WAIT)
+    shown = []
+    for position, (record, poster) in enumerate(zip(records, found), 1):
+        if poster is None:
+            continue
+        try:
+            media = poster.media()
+        except OSError:
+            # Evicted since it was looked up
+            continue
+        caption = f"{position}. {record.get('title', 'Unknown')} ({record.get('year', 'N/A')})"
+        shown.append((poster, media, caption))
+    if not shown:
+        return False
+
+    try:
+        if len(shown) == 1:
+            _, media, caption = shown[0]
+            sent = [await message.reply_photo(media, caption=caption)]
+        else:
+            sent = await message.reply_media_group([
+                InputMediaPhoto(media, caption=caption) for _, media, caption in shown
+            ])
+    except BadRequest as e:
+        # Most likely a file_id Telegram no longer accepts: upload those posters next time
+        logger.warning(f"Could not send posters: {e}")
+        posters.forget_file_ids([poster.digest for poster, _, _ in shown if poster.file_id])
+        return False
+    except TelegramError as e:
+        logger.warning(f"Could not send posters: {e}")
+        return False
+
+    for (poster, _, _), sent_message in zip(shown, sent):
+        if not poster.file_id and sent_message.photo:
+            posters.remember_file_id(poster.digest, sent_message.photo[-1].file_id)
+    return True
+
+
 async def search_show(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Search for a TV show"""
+    """Search for a TV show, optionally for a named Sonarr instance"""
     if not is_authorized(update.effective_user.id):
         await update.message.reply_text("Sorry, you are not authorized to use this bot.")
         return
@@ -96,40 +252,51 @@ async def search_show(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Please provide a show name. Example: /searchshow Breaking Bad")
         return
 
-    query = ' '.join(context.args)
+    requested, args = split_instance(context.args, sonarr)
+    query = ' '.join(args)
     await update.message.reply_text(f"🔍 Searching for '{query}'...")
 
     try:
-        results = sonarr.search_series(query)
+        # Title metadata is the same on every instance, so lookups go to the default one
+        results = await sonarr.default.search_series(query)
 
         if not results:
             await update.message.reply_text(f"No shows found for '{query}'. Try a different search term.")
             return
 
         # Show top 5 results
+        token = presented.put(('show', show.get('tvdbId'), show) for show in results[:5])
         keyboard = []
-        for show in results[:5]:
+        for position, show in enumerate(results[:5], 1):
             title = show.get('title', 'Unknown')
             year = show.get('year', 'N/A')
             tvdb_id = show.get('tvdbId')
 
             button_text = f"{title} ({year})"
-            callback_data = f"add_show_{tvdb_id}"
+            if posters is not None:
+                button_text = f"{position}. {button_text}"
+            if library.has_show(tvdb_id, requested):
+                button_text = f"✅ {button_text}"
+            callback_data = add_callback_data('show', tvdb_id, token, requested)
             keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
 
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(
-            f"Found {len(results)} results. Select a show:",
-            reply_markup=reply_markup
+        # The buttons go out straight away; the posters follow once fetched
+        await asyncio.gather(
+            update.message.reply_text(f"Found {len(results)} results. Select a show:", reply_markup=reply_markup),
+            reply_with_posters(update.message, results[:5])
         )
 
+    except BackendUnavailable as e:
+        await update.message.reply_text(f"⏳ {e}")
+
     except Exception as e:
         logger.error(f"Error searching for show: {e}")
-        await update.message.reply_text(f"Error searching for show: {str(e)}")
+        await update.message.reply_text("❌ Searching for shows failed. Please try again later.")
 
 
 async def search_movie(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Search for a movie"""
+    """Search for a movie, optionally for a named Radarr instance"""
     if not is_authorized(update.effective_user.id):
         await update.message.reply_text("Sorry, you are not authorized to use this bot.")
         return
@@ -138,40 +305,171 @@ async def search_movie(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Please provide a movie name. Example: /searchmovie Inception")
         return
 
-    query = ' '.join(context.args)
+    requested, args = split_instance(context.args, radarr)
+    query = ' '.join(args)
     await update.message.reply_text(f"🔍 Searching for '{query}'...")
 
     try:
-        results = radarr.search_movies(query)
+        results = await radarr.default.search_movies(query)
 
         if not results:
             await update.message.reply_text(f"No movies found for '{query}'. Try a different search term.")
             return
 
         # Show top 5 results
+        token = presented.put(('movie', movie.get('tmdbId'), movie) for movie in results[:5])
         keyboard = []
-        for movie in results[:5]:
+        for position, movie in enumerate(results[:5], 1):
             title = movie.get('title', 'Unknown')
             year = movie.get('year', 'N/A')
             tmdb_id = movie.get('tmdbId')
 
             button_text = f"{title} ({year})"
-            callback_data = f"add_movie_{tmdb_id}"
+            if posters is not None:
+                button_text = f"{position}. {button_text}"
+            if library.has_movie(tmdb_id, requested):
+                button_text = f"✅ {button_text}"
+            callback_data = add_callback_data('movie', tmdb_id, token, requested)
             keyboard.append([InlineKeyboardButton(button_text, callback_data=callback_data)])
 
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text(
-            f"Found {len(results)} results. Select a movie:",
-            reply_markup=reply_markup
+        await asyncio.gather(
+            update.message.reply_text(f"Found {len(results)} results. Select a movie:", reply_markup=reply_markup),
+            reply_with_posters(update.message, results[:5])
         )
 
+    except BackendUnavailable as e:
+        await update.message.reply_text(f"⏳ {e}")
+
     except Exception as e:
         logger.error(f"Error searching for movie: {e}")
-        await update.message.reply_text(f"Error searching for movie: {str(e)}")
+        await update.message.reply_text("❌ Searching for movies failed. Please try again later.")
+
+
+COMBINED_RESULTS = 8  # Buttons shown for a combined show+movie search
+
+
+def rank_combined(query: str, shows: list, movies: list, limit: int = COMBINED_RESULTS) -> list:
+    """
+    Merge show and movie lookup results into one ranked list of (kind, record)
+
+    Ranked by title similarity to the query, with a small penalty for the
+    position each backend gave the result, so upstream relevance still counts.
+    """
+    ranked = []
+    for kind, results in (('show', shows), ('movie', movies)):
+        for position, record in enumerate(results[:limit]):
+            score = similarity(query, record.get('title', '')) - 0.02 * position
+            ranked.append((score, kind, record))
+    ranked.sort(key=lambda item: item[0], reverse=True)
+    return [(kind, record) for _, kind, record in ranked[:limit]]
+
+
+def combined_keyboard(query: str, shows: list, movies: list) -> InlineKeyboardMarkup:
+    ranked = [
+        (kind, record.get('tvdbId') if kind == 'show' else record.get('tmdbId'), record)
+        for kind, record in rank_combined(query, shows, movies)
+    ]
+    token = presented.put(ranked)
+    keyboard = []
+    for kind, media_id, record in ranked:
+        title = record.get('title', 'Unknown')
+        year = record.get('year', 'N/A')
+        if kind == 'show':
+            button_text = f"📺 {title} ({year})"
+            in_library = library.has_show(media_id)
+        else:
+            button_text = f"🎥 {title} ({year})"
+            in_library = library.has_movie(media_id)
+        if in_library:
+            button_text = f"✅ {button_text}"
+        keyboard.append([
+            InlineKeyboardButton(button_text, callback_data=add_callback_data(kind, media_id, token))
+        ])
+    return InlineKeyboardMarkup(keyboard)
+
+
+async def search_combined(update: Update, query: str):
+    """
+    Search shows and movies concurrently and merge the results
+
+    The first backend to answer fills the keyboard straight away; the
+    message is edited again when the slower one arrives, so the user
+    waits for the faster call and the total is the slower call.
+    """
+    status_message = await update.message.reply_text(f"🔍 Searching shows and movies for '{query}'...")
+
+    tasks = {
+        asyncio.create_task(sonarr.default.search_series(query)): 'show',
+        asyncio.create_task(radarr.default.search_movies(query)): 'movie',
+    }
+    results = {'show': [], 'movie': []}
+    errors = []
+    pending = set(tasks)
+
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            try:
+                results[tasks[task]] = task.result() or []
+            except Exception as e:
+                logger.error(f"Error in combined {tasks[task]} search: {e}")
+                errors.append(str(e) if isinstance(e, BackendUnavailable) else f"the {tasks[task]} search failed")
+
+        shows, movies = results['show'], results['movie']
+        if not shows and not movies:
+            if pending:
+                continue
+            if errors:
+                await status_message.edit_text(f"Error searching: {'; '.join(errors)}")
+            else:
+                await status_message.edit_text(f"Nothing found for '{query}'. Try a different search term.")
+            return
+
+        text = f"Found {len(shows)} shows and {len(movies)} movies. Select one:"
+        if pending:
+            waiting_for = 'movies' if tasks[next(iter(pending))] == 'movie' else 'shows'
+            text += f"\n⏳ Still searching {waiting_for}..."
+        await status_message.edit_text(text, reply_markup=combined_keyboard(query, shows, movies))
+
+
+def parse_add_callback(data: str):
+    """
+    'add_show_{id}_{token}[_{instance}]' -> (id, token, instance)
+
+    Buttons sent before tokens existed have neither; the instance is only
+    present if the user asked for one.
+    """
+    parts = data.split('_')
+    return (
+        int(parts[2]),
+        parts[3] if len(parts) > 3 else None,
+        parts[4] if len(parts) > 4 else None
+    )
+
+
+async def add_to_pool(pool: InstancePool, kind: str, media_id: int, token: str, requested: str):
+    """
+    Add a title to the instance it routes to; returns (added record, instance name)
+
+    Routing by genre needs the lookup record. If the presented record has
+    expired it is looked up again, unless no instance has genre rules.
+    """
+    record = presented.get(token, kind, media_id)
+    if record is None and pool.genres and requested not in pool:
+        if kind == 'show':
+            results = await pool.default.search_series(f'tvdb:{media_id}')
+            record = results[0] if results else None
+        else:
+            record = await pool.default.lookup_movie(media_id) or None
+    instance = pool.route(record, requested)
+    if kind == 'show':
+        return await pool[instance].add_series_by_id(media_id, record), instance
+    return await pool[instance].add_movie_by_id(media_id, record), instance
 
 
 async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle button callbacks for adding shows/movies"""
+    """Handle button callbacks for adding shows/movies and paging the library"""
     query = update.callback_query
     await query.answer()
 
@@ -183,59 +481,144 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         if data.startswith('add_show_'):
-            tvdb_id = int(data.split('_')[2])
+            tvdb_id, token, requested = parse_add_callback(data)
             await query.edit_message_text("📺 Adding TV show to Sonarr...")
 
-            result = sonarr.add_series_by_id(tvdb_id)
+            result, instance = await add_to_pool(sonarr, 'show', tvdb_id, token, requested)
+            library.upsert_show(result, instance)
             title = result.get('title', 'Unknown')
+            requests_store.record(query.from_user.id, 'show', tvdb_id, title)
 
             await query.edit_message_text(
                 f"✅ '{title}' has been added!\n"
-                f"Sonarr is now searching for episodes. You'll be notified when they're ready."
+                f"{sonarr[instance].display_name} is now searching for episodes. "
+                f"You'll be notified when they're ready."
             )
 
         elif data.startswith('add_movie_'):
-            tmdb_id = int(data.split('_')[2])
+            tmdb_id, token, requested = parse_add_callback(data)
             await query.edit_message_text("🎥 Adding movie to Radarr...")
 
-            result = radarr.add_movie_by_id(tmdb_id)
+            result, instance = await add_to_pool(radarr, 'movie', tmdb_id, token, requested)
+            library.upsert_movie(result, instance)
             title = result.get('title', 'Unknown')
+            requests_store.record(query.from_user.id, 'movie', tmdb_id, title)
 
             await query.edit_message_text(
                 f"✅ '{title}' has been added!\n"
-                f"Radarr is now searching for the movie. You'll be notified when it's ready."
+                f"{radarr[instance].display_name} is now searching for the movie. "
+                f"You'll be notified when it's ready."
             )
 
+        elif data.startswith('lib_'):
+            _, library_name, filter_name, direction, cursor = data.split('_')
+            cursor = int(cursor)
+            message, reply_markup = format_library_page(
+                library_name, filter_name,
+                after=cursor if direction == 'n' else None,
+                before=cursor if direction == 'p' else None
+            )
+            if message is None:
+                await query.edit_message_text("Nothing left to show here.")
+            else:
+                await query.edit_message_text(message, reply_markup=reply_markup)
+
+    except BackendUnavailable as e:
+        await query.edit_message_text(f"⏳ {e}")
+
     except Exception as e:
         logger.error(f"Error in button callback: {e}")
-        await query.edit_message_text(f"❌ Error: {str(e)}")
+        await query.edit_message_text("❌ Something went wrong. Please try again later.")
 
 
-async def my_shows(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """List all TV shows in Sonarr"""
-    if not is_authorized(update.effective_user.id):
-        await update.message.reply_text("Sorry, you are not authorized to use this bot.")
-        return
+LIBRARY_PAGE_SIZE = 20  # Keeps each page well under Telegram's message length limit
 
-    await update.message.reply_text("📺 Fetching your TV shows...")
 
-    try:
-        shows = sonarr.get_series_list()
+def format_library_page(library_name: str, filter_name: str = 'all',
+                        after: int = None, before: int = None):
+    """
+    Render one page of the library index with prev/next buttons
+
+    Button callback data carries a keyset cursor (the row ID of the first
+    or last row shown), so paging reads only the next page from the index.
+    Titles from instances other than the default one are tagged with it.
+    Returns (text, reply_markup), or (None, None) if nothing matched.
+    """
+    # Stale-while-revalidate: answer from the snapshot, refresh it behind the scenes
+    library.request_sync(library_name, config.LIBRARY_MAX_AGE)
+
+    total = library.count(library_name, filter_name)
+    if not total:
+        return None, None
 
-        if not shows:
+    rows, offset, has_prev, has_next = library.page(
+        library_name, filter_name, after=after, before=before, limit=LIBRARY_PAGE_SIZE
+    )
+
+    def tag(row) -> str:
+        return f" [{row['instance']}]" if row['instance'] != 'default' else ""
+
+    if library_name == 'shows':
+        heading = "📺 Your TV Shows"
+        lines = [f"• {show['title']}{tag(show)} - {show['status'] or 'Unknown'}" for show in rows]
+    else:
+        heading = "🎥 Your Movies"
+        lines = [
+            f"• {movie['title']} ({movie['year'] or 'N/A'}){tag(movie)} - "
+            f"{'Downloaded' if movie['has_file'] else 'Searching'}"
+            for movie in rows
+        ]
+    if filter_name != 'all':
+        heading += f" - {filter_name}"
+
+    message = f"{heading} ({total} total):\n\n" + "\n".join(lines)
+    if rows:
+        message += f"\n\nShowing {offset + 1}-{offset + len(rows)} of {total}"
+
+    buttons = []
+    if has_prev and rows:
+        buttons.append(InlineKeyboardButton(
+            "◀️ Prev", callback_data=f"lib_{library_name}_{filter_name}_p_{rows[0]['row_id']}"
+        ))
+    if has_next and rows:
+        buttons.append(InlineKeyboardButton(
+            "Next ▶️", callback_data=f"lib_{library_name}_{filter_name}_n_{rows[-1]['row_id']}"
+        ))
+    reply_markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    return message, reply_markup
+
+
+async def reply_library_page(update: Update, context: ContextTypes.DEFAULT_TYPE, library_name: str):
+    """Shared body of /myshows and /mymovies"""
+    filters_available = library_filters[library_name]
+    filter_name = context.args[0].lower() if context.args else 'all'
+    if filter_name not in filters_available:
+        await update.message.reply_text(
+            f"Unknown filter '{filter_name}'. Available filters: {', '.join(filters_available)}"
+        )
+        return
+
+    message, reply_markup = format_library_page(library_name, filter_name)
+    if message is None:
+        if library.synced_at(library_name) is None:
+            await update.message.reply_text("Your library is still being indexed, try again in a moment.")
+        elif library_name == 'shows':
             await update.message.reply_text("No TV shows found in your library.")
-            return
+        else:
+            await update.message.reply_text("No movies found in your library.")
+        return
 
-        message = f"📺 Your TV Shows ({len(shows)} total):\n\n"
-        for show in shows[:20]:  # Limit to 20 to avoid message length issues
-            title = show.get('title', 'Unknown')
-            status = show.get('status', 'Unknown')
-            message += f"• {title} - {status}\n"
+    await update.message.reply_text(message, reply_markup=reply_markup)
 
-        if len(shows) > 20:
-            message += f"\n... and {len(shows) - 20} more"
 
-        await update.message.reply_text(message)
+async def my_shows(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """List TV shows from the local library index, optionally filtered by status"""
+    if not is_authorized(update.effective_user.id):
+        await update.message.reply_text("Sorry, you are not authorized to use this bot.")
+        return
+
+    try:
+        await reply_library_page(update, context, 'shows')
 
     except Exception as e:
         logger.error(f"Error fetching shows: {e}")
@@ -243,54 +626,488 @@ async def my_shows(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def my_movies(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """List all movies in Radarr"""
+    """List movies from the local library index, optionally filtered (e.g. missing)"""
     if not is_authorized(update.effective_user.id):
         await update.message.reply_text("Sorry, you are not authorized to use this bot.")
         return
 
-    await update.message.reply_text("🎥 Fetching your movies...")
-
     try:
-        movies = radarr.get_movies_list()
+        await reply_library_page(update, context, 'movies')
 
-        if not movies:
-            await update.message.reply_text("No movies found in your library.")
+    except Exception as e:
+        logger.error(f"Error fetching movies: {e}")
+        await update.message.reply_text(f"Error fetching movies: {str(e)}")
+
+
+BULK_PROGRESS_INTERVAL = 2.0  # Seconds between progress edits, to stay clear of Telegram flood limits
+BULK_MAX_FILE_BYTES = 256 * 1024
+
+
+async def add_list(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Bulk add titles, one per line, from the message or an attached .txt file"""
+    if not is_authorized(update.effective_user.id):
+        await update.message.reply_text("Sorry, you are not authorized to use this bot.")
+        return
+
+    message = update.message
+    if message.document:
+        if message.document.file_size and message.document.file_size > BULK_MAX_FILE_BYTES:
+            await message.reply_text("That file is too large. Please send a plain text list under 256 KB.")
+            return
+        try:
+            document = await message.document.get_file()
+            text = (await document.download_as_bytearray()).decode('utf-8', errors='replace')
+        except TelegramError as e:
+            logger.error(f"Error downloading list: {e}")
+            await message.reply_text(f"Error reading your list: {str(e)}")
             return
+    else:
+        parts = message.text.split(None, 1)
+        text = parts[1] if len(parts) > 1 else ''
+
+    entries = parse_entries(text, config.BULK_ADD_MAX_ENTRIES)
+    if not entries:
+        await message.reply_text(
+            "Send one title per line after /addlist, or attach a .txt file with /addlist as caption.\n"
+            "Lines may also be 'movie: Title', 'show: Title', 'Title (2010)', 'tvdb:81189' or 'tmdb:27205'."
+        )
+        return
 
-        message = f"🎥 Your Movies ({len(movies)} total):\n\n"
-        for movie in movies[:20]:  # Limit to 20 to avoid message length issues
-            title = movie.get('title', 'Unknown')
-            year = movie.get('year', 'N/A')
-            status = "Downloaded" if movie.get('hasFile') else "Searching"
-            message += f"• {title} ({year}) - {status}\n"
+    user_id = update.effective_user.id
+    status_message = await message.reply_text(f"📋 Adding {len(entries)} titles...")
+    counts = {ADDED: 0, EXISTS: 0, NOT_FOUND: 0, FAILED: 0}
+    details = []
+    last_edit = time.monotonic()
+
+    async def on_result(outcome: str, label: str, kind: str, record: dict, instance: str):
+        nonlocal last_edit
+        counts[outcome] += 1
+        if outcome == ADDED:
+            if kind == 'show':
+                library.upsert_show(record, instance)
+                requests_store.record(user_id, 'show', record['tvdbId'], record.get('title', label))
+            else:
+                library.upsert_movie(record, instance)
+                requests_store.record(user_id, 'movie', record['tmdbId'], record.get('title', label))
+            details.append(f"✅ {label}" if instance == 'default' else f"✅ {label} [{instance}]")
+        elif outcome == EXISTS:
+            details.append(f"📚 {label} (already in library)")
+        elif outcome == NOT_FOUND:
+            details.append(f"❓ {label} (not found)")
+        else:
+            details.append(f"❌ {label}")
+
+        done = sum(counts.values())
+        if done < len(entries) and time.monotonic() - last_edit >= BULK_PROGRESS_INTERVAL:
+            last_edit = time.monotonic()
+            try:
+                await status_message.edit_text(f"📋 Processed {done}/{len(entries)} titles...")
+            except TelegramError as e:
+                # Progress is best effort; the summary below still goes out
+                logger.warning(f"Could not update /addlist progress: {e}")
+
+    # Charged to the bulk budget, so the list neither crawls at the interactive
+    # rate nor holds up this user's searches
+    token = current_user.set(BulkJob(user_id))
+    try:
+        await bulk_adder.run(entries, on_result)
+    except Exception as e:
+        logger.error(f"Error in bulk add: {e}")
+    finally:
+        current_user.reset(token)
+
+    summary = (
+        f"📋 Done: {counts[ADDED]} added, {counts[EXISTS]} already in library, "
+        f"{counts[NOT_FOUND]} not found, {counts[FAILED]} failed.\n\n"
+    )
+    report = summary + "\n".join(details)
+    if len(report) > 4000:  # Telegram caps messages at 4096 characters
+        report = report[:4000] + "\n..."
+    try:
+        await status_message.edit_text(report)
+    except TelegramError as e:
+        logger.warning(f"Could not edit /addlist status, sending the summary instead: {e}")
+        await message.reply_text(report)
 
-        if len(movies) > 20:
-            message += f"\n... and {len(movies) - 20} more"
+
+async def my_requests(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """List the titles this user requested and how far along they are"""
+    if not is_authorized(update.effective_user.id):
+        await update.message.reply_text("Sorry, you are not authorized to use this bot.")
+        return
+
+    try:
+        requests = requests_store.for_user(update.effective_user.id, limit=20)
+
+        if not requests:
+            await update.message.reply_text("You haven't requested anything yet.")
+            return
+
+        message = "📝 Your Requests:\n\n"
+        for request in requests:
+            icon = "📺" if request['kind'] == 'show' else "🎥"
+            if request['state'] == DOWNLOADED:
+                status = "Downloaded"
+            elif request['state'] == DOWNLOADING:
+                status = "Downloading"
+            else:
+                status = "Searching"
+            message += f"{icon} {request['title']} - {status}\n"
 
         await update.message.reply_text(message)
 
     except Exception as e:
-        logger.error(f"Error fetching movies: {e}")
-        await update.message.reply_text(f"Error fetching movies: {str(e)}")
+        logger.error(f"Error fetching requests: {e}")
+        await update.message.reply_text(f"Error fetching requests: {str(e)}")
+
+
+ACTIVITY_MAX_ENTRIES = 20  # Keeps /queue and /upcoming well under Telegram's message length limit
+
+
+def activity_footer() -> str:
+    return f"\n\nUpdated {format_duration(int(activity.age()))} ago"
+
+
+async def show_queue(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show download progress from the shared activity snapshot"""
+    if not is_authorized(update.effective_user.id):
+        await update.message.reply_text("Sorry, you are not authorized to use this bot.")
+        return
+
+    if activity.updated_at is None:
+        await update.message.reply_text("Still fetching the download queue, try again in a moment.")
+        return
+
+    requested = {
+        (request['kind'], request['media_id'])
+        for request in requests_store.for_user(update.effective_user.id, limit=100)
+    }
+    only_mine = bool(context.args) and context.args[0].lower() == 'mine'
+    entries = [
+        entry for entry in activity.queue
+        if not only_mine or (entry.kind, entry.media_id) in requested
+    ]
+    if not entries:
+        empty = "None of your requests are downloading right now." if only_mine else "Nothing is downloading right now."
+        await update.message.reply_text(empty + activity_footer())
+        return
+
+    message = f"📥 Download Queue ({len(entries)}):\n"
+    for entry in entries[:ACTIVITY_MAX_ENTRIES]:
+        icon = "📺" if entry.kind == 'show' else "🎥"
+        mine = " ⭐" if (entry.kind, entry.media_id) in requested else ""
+        detail = f" {entry.detail}" if entry.kind == 'show' else f" ({entry.detail or 'N/A'})"
+        if entry.instance != 'default':
+            detail += f" [{entry.instance}]"
+        status = entry.status
+        if status == 'downloading' and entry.time_left:
+            status = f"{format_duration(entry.time_left)} left"
+        message += (
+            f"\n{icon} {entry.title}{detail}{mine}\n"
+            f"   {progress_bar(entry.progress)} {entry.progress:.0%} · {status}"
+        )
+    if len(entries) > ACTIVITY_MAX_ENTRIES:
+        message += f"\n\n…and {len(entries) - ACTIVITY_MAX_ENTRIES} more"
+
+    await update.message.reply_text(message + activity_footer())
+
+
+async def show_upcoming(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """List episodes and movie releases due soon from the shared activity snapshot"""
+    if not is_authorized(update.effective_user.id):
+        await update.message.reply_text("Sorry, you are not authorized to use this bot.")
+        return
+
+    if activity.updated_at is None:
+        await update.message.reply_text("Still fetching the calendar, try again in a moment.")
+        return
+
+    entries = activity.upcoming
+    if not entries:
+        await update.message.reply_text(
+            f"Nothing due in the next {config.UPCOMING_DAYS} days." + activity_footer()
+        )
+        return
+
+    message = f"📅 Coming up in the next {config.UPCOMING_DAYS} days:\n"
+    day = None
+    for entry in entries[:ACTIVITY_MAX_ENTRIES]:
+        # Air times in the bot host's local time; movie release dates carry no meaningful time
+        when = entry.when.astimezone() if entry.kind == 'show' else entry.when
+        if when.strftime('%a %d %b') != day:
+            day = when.strftime('%a %d %b')
+            message += f"\n{day}\n"
+        if entry.kind == 'show':
+            message += f"📺 {when.strftime('%H:%M')} {entry.title} - {entry.detail}\n"
+        else:
+            message += f"🎥 {entry.title} - {entry.detail}\n"
+    if len(entries) > ACTIVITY_MAX_ENTRIES:
+        message += f"\n…and {len(entries) - ACTIVITY_MAX_ENTRIES} more"
+
+    await update.message.reply_text(message.rstrip() + activity_footer())
 
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle plain text messages - try to guess if it's a show or movie"""
+    """
+    Handle plain text messages
+
+    The local title index answers "is it already in the library?" first;
+    its best match also decides whether to search shows or movies. With
+    no hint either way, shows and movies are searched together.
+    """
     if not is_authorized(update.effective_user.id):
         await update.message.reply_text("Sorry, you are not authorized to use this bot.")
         return
 
     text = update.message.text.strip()
 
-    # Simple heuristic: if it contains "movie" or "film", search movies, otherwise TV
+    # An explicit "movie"/"film" still restricts the search to movies
+    kind = None
     if 'movie' in text.lower() or 'film' in text.lower():
-        # Remove the word "movie" or "film" from the query
-        query = text.lower().replace('movie', '').replace('film', '').strip()
-        context.args = query.split()
+        kind = 'movie'
+        text = text.lower().replace('movie', '').replace('film', '').strip()
+
+    matches = titles.search(text, kind=kind)
+    if matches:
+        message = "📚 Already in your library:\n\n"
+        for match in matches:
+            icon = "📺" if match.kind == 'show' else "🎥"
+            message += f"{icon} {match.title} ({match.year or 'N/A'})\n"
+        if matches[0].score >= EXACT_MATCH_SCORE:
+            message += "\nNot what you meant? Use /searchshow or /searchmovie."
+            await update.message.reply_text(message)
+            return
+        await update.message.reply_text(message)
+        if kind is None and matches[0].score >= KIND_HINT_SCORE:
+            kind = matches[0].kind
+
+    context.args = text.split()
+    if kind == 'movie':
         await search_movie(update, context)
-    else:
-        context.args = text.split()
+    elif kind == 'show':
         await search_show(update, context)
+    else:
+        # Ambiguous: ask both backends at once
+        await search_combined(update, ' '.join(context.args))
+
+
+INLINE_RESULTS = 10  # Results listed for an inline query
+
+
+async def inline_lookup(term: str) -> list:
+    """Shows and movies for an inline query, as (kind, record) pairs; fails only if both lookups fail"""
+    shows, movies = await asyncio.gather(
+        sonarr.default.search_series(term), radarr.default.search_movies(term), return_exceptions=True
+    )
+    if isinstance(shows, Exception) and isinstance(movies, Exception):
+        raise shows
+    return [
+        (kind, record)
+        for kind, records in (('show', shows), ('movie', movies)) if not isinstance(records, Exception)
+        for record in records or []
+    ]
+
+
+# Debounced, cancellable inline lookups, reusing the results of earlier keystrokes
+inline_search = InlineSearch(
+    inline_lookup, config.INLINE_DEBOUNCE, config.INLINE_MIN_QUERY,
+    config.LOOKUP_CACHE_SIZE, config.LOOKUP_CACHE_TTL
+)
+
+
+def inline_article(kind: str, media_id: int, record: dict, token: str) -> InlineQueryResultArticle:
+    title = record.get('title', 'Unknown')
+    year = record.get('year', 'N/A')
+    icon = "📺" if kind == 'show' else "🎥"
+    in_library = library.has_show(media_id) if kind == 'show' else library.has_movie(media_id)
+    overview = record.get('overview') or ''
+    return InlineQueryResultArticle(
+        id=f"{kind}_{media_id}",
+        title=f"{'✅ ' if in_library else ''}{icon} {title} ({year})",
+        description=overview[:120],
+        thumbnail_url=poster_url(record),
+        input_message_content=InputTextMessageContent(
+            f"{icon} {title} ({year})" + (f"\n\n{overview[:500]}" if overview else "")
+        ),
+        reply_markup=InlineKeyboardMarkup([[
+            InlineKeyboardButton("➕ Add", callback_data=add_callback_data(kind, media_id, token))
+        ]])
+    )
+
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Answer '@bot <title>' from any chat with matching shows and movies
+
+    Every keystroke arrives as its own query; superseded ones are never
+    answered, as Telegram only shows the newest. Answers are personal
+    (they mark titles already in the library and the Add button only
+    works for allowed users) and cached by Telegram for INLINE_CACHE_TIME.
+    """
+    inline = update.inline_query
+    if not is_authorized(inline.from_user.id):
+        await inline.answer([], cache_time=0, is_personal=True)
+        return
+
+    term = normalize_query(inline.query)
+    if len(term) < config.INLINE_MIN_QUERY:
+        await inline.answer([], cache_time=config.INLINE_CACHE_TIME, is_personal=True)
+        return
+
+    try:
+        results = await inline_search.search(inline.from_user.id, term)
+        if results is None:
+            return
+        ranked = [
+            (kind, record.get('tvdbId') if kind == 'show' else record.get('tmdbId'), record)
+            for kind, record in rank_combined(
+                term,
+                [record for kind, record in results if kind == 'show'],
+                [record for kind, record in results if kind == 'movie'],
+                limit=INLINE_RESULTS
+            )
+        ]
+        token = presented.put(ranked)
+        await inline.answer(
+            [inline_article(kind, media_id, record, token) for kind, media_id, record in ranked],
+            cache_time=config.INLINE_CACHE_TIME, is_personal=True
+        )
+
+    except BadRequest as e:
+        # Usually the query expired while the lookup ran
+        logger.warning(f"Could not answer inline query: {e}")
+
+    except Exception as e:
+        logger.error(f"Error in inline search: {e}")
+
+
+async def start_background_tasks(application: Application):
+    """Start the library index sync, cache warm-up and the webhook endpoint once the Application is running"""
+    application.bot_data['library_sync'] = asyncio.create_task(
+        library.run_sync(sonarr, radarr, config.LIBRARY_SYNC_INTERVAL)
+    )
+    # Refreshed at half the TTL so commands never wait on root folders or quality profiles
+    application.bot_data['defaults_refresh'] = [
+        asyncio.create_task(client.run_defaults_refresh(config.DEFAULTS_CACHE_TTL / 2))
+        for client in [*sonarr, *radarr]
+    ]
+    application.bot_data['requests_flusher'] = asyncio.create_task(requests_store.run_flusher())
+    application.bot_data['activity_refresh'] = asyncio.create_task(
+        activity.run(config.ACTIVITY_REFRESH_INTERVAL)
+    )
+    if missing_search is not None:
+        application.bot_data['missing_search'] = asyncio.create_task(missing_search.run())
+
+    async def send_notification(user_id: int, text: str):
+        try:
+            await application.bot.send_message(user_id, text)
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await application.bot.send_message(user_id, text)
+
+    notifier.send = send_notification
+    notifier.start()
+    application.bot_data['web_runner'] = await start_web_server(
+        create_web_app(notifier), config.HTTP_LISTEN_HOST, config.HTTP_LISTEN_PORT
+    )
+
+
+async def stop_background_tasks(application: Application):
+    """Stop background tasks and close the Sonarr/Radarr HTTP sessions"""
+    for name in ('library_sync', 'requests_flusher', 'activity_refresh', 'missing_search'):
+        task = application.bot_data.pop(name, None)
+        if task is not None:
+            task.cancel()
+    for task in application.bot_data.pop('defaults_refresh', []):
+        task.cancel()
+    runner = application.bot_data.pop('web_runner', None)
+    if runner is not None:
+        await runner.cleanup()
+    await notifier.stop()
+    await sonarr.close()
+    await radarr.close()
+    if posters is not None:
+        await posters.close()
+    if missing_search is not None:
+        missing_search.close()
+    library.close()
+    requests_store.close()
+
+
+# Only the update types the handlers below consume
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.INLINE_QUERY]
+
+
+def build_application(request=None) -> Application:
+    """
+    Create the Application with every handler registered
+
+    ``request`` replaces the Bot API backend, e.g. with the offline one
+    used by the benchmark harness in bench/.
+    """
+    application = (
+        Application.builder()
+        .token(config.TELEGRAM_BOT_TOKEN)
+        .request(request or InstrumentedRequest(connection_pool_size=config.TELEGRAM_CONNECTION_POOL_SIZE))
+        .concurrent_updates(FairUpdateProcessor(config.UPDATE_CONCURRENCY, config.USER_UPDATE_CONCURRENCY))
+        .post_init(start_background_tasks)
+        .post_shutdown(stop_background_tasks)
+        .build()
+    )
+
+    # Cache and queue statistics are read only when /metrics is scraped
+    # Per instance, labelled e.g. 'sonarr' and 'sonarr-4k'
+    register_stats(
+        'lookup_cache',
+        {**sonarr.stats_sources('lookup_cache'), **radarr.stats_sources('lookup_cache')},
+        counters=('hits', 'misses', 'coalesced', 'abandoned')
+    )
+    register_stats(
+        'upstream_queue',
+        {**sonarr.stats_sources('limiter'), **radarr.stats_sources('limiter')},
+        counters=('waits', 'wait_seconds_total')
+    )
+    register_stats('presented_results', {'bot': presented.stats}, counters=('hits', 'misses'))
+    register_stats('inline_search', {'bot': inline_search.stats}, counters=('lookups', 'reused', 'superseded'))
+    if missing_search is not None:
+        register_stats(
+            'missing_search', {'bot': missing_search.stats}, counters=('searched', 'commands', 'failures')
+        )
+    if posters is not None:
+        register_stats(
+            'poster_cache', {'bot': posters.stats}, counters=('file_id_hits', 'disk_hits', 'fetches', 'failures')
+        )
+    register_stats('circuit', {**sonarr.stats_sources('breaker'), **radarr.stats_sources('breaker')})
+    register_stats('notification_queue', {'telegram': lambda: {'depth': notifier.queue.qsize()}})
+
+    # Runs before every other handler (group -1) to tag the update's user
+    application.add_handler(TypeHandler(Update, track_user), group=-1)
+
+    # Add command handlers
+    application.add_handler(CommandHandler("start", instrument_handler(start)))
+    application.add_handler(CommandHandler("help", instrument_handler(help_command)))
+    application.add_handler(CommandHandler("searchshow", instrument_handler(search_show)))
+    application.add_handler(CommandHandler("searchmovie", instrument_handler(search_movie)))
+    application.add_handler(CommandHandler("myshows", instrument_handler(my_shows)))
+    application.add_handler(CommandHandler("mymovies", instrument_handler(my_movies)))
+    application.add_handler(CommandHandler("myrequests", instrument_handler(my_requests)))
+    application.add_handler(CommandHandler("queue", instrument_handler(show_queue)))
+    application.add_handler(CommandHandler("upcoming", instrument_handler(show_upcoming)))
+    application.add_handler(CommandHandler("addlist", instrument_handler(add_list)))
+    application.add_handler(MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r'^/addlist'), instrument_handler(add_list)
+    ))
+
+    # Add callback handler for buttons
+    application.add_handler(CallbackQueryHandler(instrument_handler(button_callback)))
+
+    # Inline mode: @bot <title> from any chat
+    application.add_handler(InlineQueryHandler(instrument_handler(inline_query)))
+
+    # Add message handler for plain text
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, instrument_handler(handle_text)))
+
+    return application
 
 
 def main():
@@ -302,26 +1119,25 @@ def main():
         logger.error(f"Configuration error: {e}")
         return
 
-    # Create the Application
-    application = Application.builder().token(config.TELEGRAM_BOT_TOKEN).build()
-
-    # Add command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("searchshow", search_show))
-    application.add_handler(CommandHandler("searchmovie", search_movie))
-    application.add_handler(CommandHandler("myshows", my_shows))
-    application.add_handler(CommandHandler("mymovies", my_movies))
-
-    # Add callback handler for buttons
-    application.add_handler(CallbackQueryHandler(button_callback))
-
-    # Add message handler for plain text
-    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
+    application = build_application()
 
     # Start the bot
-    logger.info("ZulianTV Bot is starting...")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    if config.TELEGRAM_MODE == 'webhook':
+        logger.info(f"ZulianTV Bot is starting (webhook on {config.WEBHOOK_LISTEN}:{config.WEBHOOK_PORT})...")
+        application.run_webhook(
+            listen=config.WEBHOOK_LISTEN,
+            port=config.WEBHOOK_PORT,
+            url_path=config.WEBHOOK_PATH,
+            webhook_url=config.WEBHOOK_URL,
+            secret_token=config.WEBHOOK_SECRET_TOKEN,
+            cert=config.WEBHOOK_CERT,
+            key=config.WEBHOOK_KEY,
+            max_connections=config.WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=ALLOWED_UPDATES
+        )
+    else:
+        logger.info("ZulianTV Bot is starting...")
+        application.run_polling(allowed_updates=ALLOWED_UPDATES)
 
 
 if __name__ == '__main__':
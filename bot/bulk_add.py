@@ -0,0 +1,180 @@
+"""
+Bulk import of many titles in one pass (/addlist)
+"""
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from title_index import similarity
+
+logger = logging.getLogger(__name__)
+
+BULLET_RE = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s*')
+ID_RE = re.compile(r'^(tvdb|tmdb):\s*(\d+)$', re.IGNORECASE)
+KIND_RE = re.compile(r'^(show|tv|series|movie|film):\s*(.+)$', re.IGNORECASE)
+YEAR_RE = re.compile(r'\s*\((\d{4})\)\s*$')
+
+# Below this title similarity a lookup result is not trusted as the intended title
+MIN_MATCH_SCORE = 0.5
+
+# Outcomes reported per entry
+ADDED = 'added'
+EXISTS = 'exists'
+NOT_FOUND = 'not_found'
+FAILED = 'failed'
+
+
+def parse_entries(text: str, limit: int) -> List[str]:
+    """
+    Split a watchlist into entries, one per line
+
+    Bullets and numbering are stripped, blank lines and '#' comments
+    skipped, and duplicates dropped. At most ``limit`` entries are kept.
+    """
+    entries = []
+    seen = set()
+    for line in text.splitlines():
+        entry = BULLET_RE.sub('', line).strip()
+        if not entry or entry.startswith('#'):
+            continue
+        key = entry.casefold()
+        if key not in seen:
+            seen.add(key)
+            entries.append(entry)
+    return entries[:limit]
+
+
+class BulkAdder:
+    """
+    Resolves and adds a list of titles with bounded concurrency
+
+    Entries may be 'tvdb:81189', 'tmdb:27205', 'show: Title',
+    'movie: Title' or just a title (optionally with '(year)'), in which
+    case shows and movies are both looked up and the closest title wins.
+    Lookups go to the default instance of each pool; each title is then
+    added to the instance its genres route it to, and skipped if that
+    instance already has it. Movies are added without an immediate search
+    and then searched with one MoviesSearch command per instance. Sonarr
+    has no multi-series search command, so shows keep their per-series
+    search on add.
+    """
+
+    def __init__(self, sonarr, radarr, library, concurrency: int = 4):
+        self.sonarr = sonarr
+        self.radarr = radarr
+        self.library = library
+        self.concurrency = concurrency
+
+    async def _resolve(self, entry: str) -> Optional[Tuple[str, Dict]]:
+        """Find the lookup record an entry refers to, as (kind, record)"""
+        id_match = ID_RE.match(entry)
+        if id_match:
+            source, media_id = id_match.group(1).lower(), int(id_match.group(2))
+            if source == 'tvdb':
+                results = await self.sonarr.default.search_series(f'tvdb:{media_id}')
+                return ('show', results[0]) if results else None
+            movie = await self.radarr.default.lookup_movie(media_id)
+            return ('movie', movie) if movie else None
+
+        kind = None
+        kind_match = KIND_RE.match(entry)
+        if kind_match:
+            kind = 'movie' if kind_match.group(1).lower() in ('movie', 'film') else 'show'
+            entry = kind_match.group(2).strip()
+
+        year = None
+        year_match = YEAR_RE.search(entry)
+        if year_match:
+            year = int(year_match.group(1))
+            entry = entry[:year_match.start()].strip()
+
+        lookups = []
+        if kind in (None, 'show'):
+            lookups.append(('show', self.sonarr.default.search_series(entry)))
+        if kind in (None, 'movie'):
+            lookups.append(('movie', self.radarr.default.search_movies(entry)))
+        # One backend being down still lets the other resolve the entry
+        results = await asyncio.gather(*(lookup for _, lookup in lookups), return_exceptions=True)
+        errors = []
+
+        best = None
+        for (result_kind, _), records in zip(lookups, results):
+            if isinstance(records, Exception):
+                logger.warning(f"Bulk add: {result_kind} lookup for '{entry}' failed: {records}")
+                errors.append(records)
+                continue
+            for position, record in enumerate((records or [])[:5]):
+                score = similarity(entry, record.get('title', '')) - 0.02 * position
+                if year is not None and record.get('year') == year:
+                    score += 0.2
+                if best is None or score > best[0]:
+                    best = (score, result_kind, record)
+
+        if best is None or best[0] < MIN_MATCH_SCORE:
+            if errors:
+                # The failed lookup may have been the one to find it: report a failure, not "not found"
+                raise errors[0]
+            return None
+        return best[1], best[2]
+
+    def _in_library(self, kind: str, record: Dict, instance: str) -> bool:
+        if kind == 'show':
+            return self.library.has_show(record.get('tvdbId'), instance)
+        return self.library.has_movie(record.get('tmdbId'), instance)
+
+    async def _add_one(self, entry: str, claimed: Set[Tuple[str, int]],
+                       movie_ids: Dict[str, List[int]]) -> Tuple:
+        """Resolve and add one entry; returns (outcome, label, kind, added record, instance)"""
+        try:
+            resolved = await self._resolve(entry)
+            if resolved is None:
+                return NOT_FOUND, entry, None, None, None
+
+            kind, record = resolved
+            label = f"{record.get('title', entry)} ({record.get('year', 'N/A')})"
+            pool = self.sonarr if kind == 'show' else self.radarr
+            instance = pool.route(record)
+            # Two entries can resolve to the same title, e.g. a name and its ID
+            key = (kind, record.get('tvdbId') if kind == 'show' else record.get('tmdbId'))
+            if key in claimed or self._in_library(kind, record, instance):
+                return EXISTS, label, kind, None, instance
+            claimed.add(key)
+
+            client = pool[instance]
+            root_folder_path, quality_profile_id = await client.get_defaults()
+            if kind == 'show':
+                added = await client.add_series(record, root_folder_path, quality_profile_id)
+            else:
+                added = await client.add_movie(
+                    record, root_folder_path, quality_profile_id, search_for_movie=False
+                )
+                movie_ids.setdefault(instance, []).append(added['id'])
+            return ADDED, label, kind, added, instance
+
+        except Exception as e:
+            logger.error(f"Error bulk adding '{entry}': {e}")
+            return FAILED, f"{entry}: {e}", None, None, None
+
+    async def run(self, entries: List[str],
+                  on_result: Callable[..., Awaitable[None]]):
+        """
+        Process all entries, calling on_result(outcome, label, kind, record, instance) as each finishes
+
+        Returns after the batched MoviesSearch for the movies that were added.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        claimed: Set[Tuple[str, int]] = set()
+        movie_ids: Dict[str, List[int]] = {}
+
+        async def process(entry: str):
+            async with semaphore:
+                result = await self._add_one(entry, claimed, movie_ids)
+            await on_result(*result)
+
+        await asyncio.gather(*(process(entry) for entry in entries))
+
+        for instance, ids in movie_ids.items():
+            try:
+                await self.radarr[instance].search_movies_by_ids(ids)
+            except Exception as e:
+                logger.error(f"Error starting search for {len(ids)} bulk-added movies in {instance}: {e}")
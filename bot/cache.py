@@ -0,0 +1,259 @@
+"""
+Small in-process caches used by the API clients
+"""
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTTLValue:
+    """
+    A single value produced by an async loader and kept for ``ttl`` seconds
+
+    Once a value is older than ``refresh_after`` * ttl it is still served,
+    but a background reload is started so callers rarely wait on the loader.
+    Up to ``max_stale`` seconds past the TTL an expired value is served the
+    same way (stale-while-revalidate). Concurrent misses share one in-flight
+    load. With ``snapshot_path`` every loaded value is written to disk as
+    JSON and read back on startup, so a restart begins with a warm value.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[Any]], ttl: float, refresh_after: float = 0.8,
+                 max_stale: float = 0, snapshot_path: Optional[str] = None):
+        self.loader = loader
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        self.max_stale = max_stale
+        self.snapshot_path = snapshot_path
+        self._value: Any = None
+        self._loaded_at: Optional[float] = None
+        self._pending: Optional[asyncio.Task] = None
+        if snapshot_path:
+            self._read_snapshot()
+
+    def _age(self) -> float:
+        return time.monotonic() - self._loaded_at
+
+    def _read_snapshot(self):
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            age = max(0.0, time.time() - snapshot['saved_at'])
+            self._value = snapshot['value']
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable cache snapshot {self.snapshot_path}: {e}")
+            return
+        self._loaded_at = time.monotonic() - age
+
+    def _write_snapshot(self, value: Any):
+        # Write-then-rename so a crash never leaves a truncated snapshot behind
+        try:
+            directory = os.path.dirname(self.snapshot_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.snapshot_path}.tmp"
+            with open(temp_path, 'w') as f:
+                json.dump({'saved_at': time.time(), 'value': value}, f)
+            os.replace(temp_path, self.snapshot_path)
+        except (OSError, TypeError) as e:
+            logger.warning(f"Could not write cache snapshot {self.snapshot_path}: {e}")
+
+    async def _load(self) -> Any:
+        try:
+            value = await self.loader()
+        finally:
+            self._pending = None
+        self._value = value
+        self._loaded_at = time.monotonic()
+        if self.snapshot_path:
+            self._write_snapshot(value)
+        return value
+
+    def _start_load(self) -> asyncio.Task:
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._load())
+        return self._pending
+
+    def _log_refresh_failure(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Background cache refresh failed: {task.exception()}")
+
+    async def get(self) -> Any:
+        """Return the cached value, loading it if missing or too stale to serve"""
+        if self._loaded_at is not None:
+            age = self._age()
+            if age < self.ttl + self.max_stale:
+                if age >= self.ttl * self.refresh_after and self._pending is None:
+                    self._start_load().add_done_callback(self._log_refresh_failure)
+                return self._value
+
+        return await asyncio.shield(self._start_load())
+
+    async def refresh(self) -> Any:
+        """Reload now (sharing any load already in flight), e.g. from a scheduled warm-up"""
+        return await asyncio.shield(self._start_load())
+
+    def invalidate(self):
+        """Drop the cached value (and its snapshot) so the next get() reloads it"""
+        self._value = None
+        self._loaded_at = None
+        if self.snapshot_path:
+            try:
+                os.remove(self.snapshot_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove cache snapshot {self.snapshot_path}: {e}")
+
+
+def normalize_query(query: str) -> str:
+    """Normalize free-text search input so equivalent queries share a cache key"""
+    return ' '.join(query.casefold().split())
+
+
+class AsyncLRUCache:
+    """
+    Bounded LRU cache with per-entry TTL and single-flight loading
+
+    Concurrent get_or_load() calls for the same missing key share one
+    loader call. A waiter that is cancelled leaves the load running for
+    the others; once every waiter is gone the load is cancelled too, so
+    abandoned lookups (e.g. superseded inline queries) stop early.
+    Failed loads are not cached.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return a fresh cached value without loading it"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        """Store a value, evicting the least recently used entries if full"""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await loader()
+            self.set(key, value)
+            return value
+        finally:
+            # An abandoned load was unlisted already and may have been replaced since
+            if self._pending.get(key) is asyncio.current_task():
+                del self._pending[key]
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for key, calling loader at most once per miss"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            self.hits += 1
+            return value
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            pending = self._pending[key] = asyncio.ensure_future(self._load(key, loader))
+
+        # Shielded so one cancelled waiter does not abort the shared load
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1 and not pending.done():
+                pending.cancel()
+                # Unlisted now, as it may take a loop iteration to actually stop
+                del self._pending[key]
+                self.abandoned += 1
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters for logging and metrics"""
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'abandoned': self.abandoned
+        }
+
+
+# Lookup fields add_series()/add_movie() send upstream, plus genres for instance routing;
+# the rest is dropped to keep entries small
+ADD_FIELDS = ('tvdbId', 'tmdbId', 'title', 'year', 'titleSlug', 'images', 'seasons', 'genres')
+
+
+class PresentedResults:
+    """
+    Lookup records behind recently sent result buttons
+
+    Each results message stores its records under one short random token
+    carried in the buttons' callback_data, so pressing a button can add the
+    title without looking it up again. Bounded in size and age; a miss
+    (expired, evicted, or after a restart) falls back to a fresh lookup.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self._cache = AsyncLRUCache(max_size, ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def put(self, results: Iterable[Tuple[str, int, Dict]]) -> str:
+        """Store (kind, media ID, lookup record) triples and return their token"""
+        token = secrets.token_hex(4)
+        self._cache.set(token, {
+            (kind, media_id): {field: record[field] for field in ADD_FIELDS if field in record}
+            for kind, media_id, record in results
+        })
+        return token
+
+    def get(self, token: Optional[str], kind: str, media_id: int) -> Optional[Dict]:
+        """The record presented for (kind, media_id) under token, if still held"""
+        records = self._cache.get(token) if token else None
+        record = records.get((kind, media_id)) if records else None
+        if record is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return record
+
+    def stats(self) -> Dict[str, int]:
+        return {'size': len(self._cache), 'hits': self.hits, 'misses': self.misses}
@@ -9,6 +9,27 @@ load_dotenv()
 # Telegram Configuration
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 ALLOWED_USERS = [int(user_id.strip()) for user_id in os.getenv('ALLOWED_USERS', '').split(',') if user_id.strip()]
+# How updates arrive: 'polling' (default) or 'webhook'
+TELEGRAM_MODE = os.getenv('TELEGRAM_MODE', 'polling').lower()
+# Updates processed at once; further updates wait their turn
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+# Of those, at most this many from one user; their further updates wait without taking a slot
+USER_UPDATE_CONCURRENCY = int(os.getenv('USER_UPDATE_CONCURRENCY', '2'))
+# Connections to the Bot API; replies from concurrent updates each need one
+TELEGRAM_CONNECTION_POOL_SIZE = int(os.getenv('TELEGRAM_CONNECTION_POOL_SIZE', '256'))
+
+# Telegram Webhook Configuration (TELEGRAM_MODE=webhook)
+# WEBHOOK_URL is the public HTTPS URL Telegram posts to, e.g. https://bot.example.com/telegram
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+# Required in webhook mode; a blank value from docker-compose counts as unset
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN') or None
+# Optional certificate/key to terminate HTTPS in the bot instead of a reverse proxy
+WEBHOOK_CERT = os.getenv('WEBHOOK_CERT')
+WEBHOOK_KEY = os.getenv('WEBHOOK_KEY')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
 
 # Sonarr Configuration
 SONARR_URL = os.getenv('SONARR_URL', 'http://sonarr:8989')
@@ -18,6 +39,126 @@ SONARR_API_KEY = os.getenv('SONARR_API_KEY')
 RADARR_URL = os.getenv('RADARR_URL', 'http://radarr:7878')
 RADARR_API_KEY = os.getenv('RADARR_API_KEY')
 
+
+def _load_instances(service: str, url: str, api_key: str) -> list:
+    """
+    The 'default' instance plus any listed in {SERVICE}_INSTANCES
+
+    For SONARR_INSTANCES=4k,anime each name reads SONARR_4K_URL,
+    SONARR_4K_API_KEY and optionally SONARR_4K_GENRES (comma separated):
+    adds whose genres match go to that instance.
+    """
+    instances = [{'name': 'default', 'url': url, 'api_key': api_key, 'genres': []}]
+    for name in os.getenv(f'{service}_INSTANCES', '').split(','):
+        name = name.strip().lower()
+        if not name:
+            continue
+        prefix = f'{service}_{name.upper()}'
+        instances.append({
+            'name': name,
+            'url': os.getenv(f'{prefix}_URL'),
+            'api_key': os.getenv(f'{prefix}_API_KEY'),
+            'genres': [genre.strip() for genre in os.getenv(f'{prefix}_GENRES', '').split(',') if genre.strip()]
+        })
+    return instances
+
+
+# Additional instances (e.g. 4K, anime); the URL/key above are the 'default' instance
+SONARR_INSTANCES = _load_instances('SONARR', SONARR_URL, SONARR_API_KEY)
+RADARR_INSTANCES = _load_instances('RADARR', RADARR_URL, RADARR_API_KEY)
+
+# Local Storage Configuration
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+LIBRARY_INDEX_PATH = os.path.join(DATA_DIR, 'library.db')
+LIBRARY_SYNC_INTERVAL = int(os.getenv('LIBRARY_SYNC_INTERVAL', '300'))
+# Viewing a library whose snapshot of an instance is older than this (e.g. because a
+# scheduled sync failed) syncs that instance in the background, at most once per LIBRARY_MAX_AGE
+LIBRARY_MAX_AGE = int(os.getenv('LIBRARY_MAX_AGE', str(2 * LIBRARY_SYNC_INTERVAL)))
+REQUEST_STORE_PATH = os.path.join(DATA_DIR, 'requests.db')
+
+# Download Activity (/queue, /upcoming)
+# Queues and calendars are fetched once per interval and shared by all users
+ACTIVITY_REFRESH_INTERVAL = int(os.getenv('ACTIVITY_REFRESH_INTERVAL', '30'))
+UPCOMING_DAYS = int(os.getenv('UPCOMING_DAYS', '7'))
+
+# Local HTTP endpoint (Sonarr/Radarr Connect webhooks)
+HTTP_LISTEN_HOST = os.getenv('HTTP_LISTEN_HOST', '0.0.0.0')
+HTTP_LISTEN_PORT = int(os.getenv('HTTP_LISTEN_PORT', '8000'))
+# Sonarr/Radarr send it as ?token=...; without one the webhook route is not served at all
+ARR_WEBHOOK_TOKEN = os.getenv('ARR_WEBHOOK_TOKEN') or None
+
+# Cache Configuration
+# Root folders and quality profiles rarely change, keep them for an hour
+DEFAULTS_CACHE_TTL = int(os.getenv('DEFAULTS_CACHE_TTL', '3600'))
+# Once expired they are still served for up to a day while a refresh runs
+DEFAULTS_MAX_STALE = int(os.getenv('DEFAULTS_MAX_STALE', '86400'))
+# Title lookups (series/lookup, movie/lookup) are cached per normalized query
+LOOKUP_CACHE_SIZE = int(os.getenv('LOOKUP_CACHE_SIZE', '512'))
+LOOKUP_CACHE_TTL = int(os.getenv('LOOKUP_CACHE_TTL', '900'))
+# Search results behind buttons, so an add skips the lookup if pressed within the TTL
+PRESENTED_RESULTS_SIZE = int(os.getenv('PRESENTED_RESULTS_SIZE', '1000'))
+PRESENTED_RESULTS_TTL = int(os.getenv('PRESENTED_RESULTS_TTL', '3600'))
+
+# Upstream Rate Limiting
+# Each Telegram user may make USER_RATE_LIMIT upstream calls per second on
+# average, with bursts of up to USER_RATE_BURST; excess calls wait.
+USER_RATE_LIMIT = float(os.getenv('USER_RATE_LIMIT', '0.5'))
+USER_RATE_BURST = int(os.getenv('USER_RATE_BURST', '5'))
+# Concurrent requests allowed per backend; the rest queue fairly per user
+UPSTREAM_MAX_CONCURRENCY = int(os.getenv('UPSTREAM_MAX_CONCURRENCY', '4'))
+
+# Upstream Resilience
+ARR_TIMEOUT = float(os.getenv('ARR_TIMEOUT', '10'))
+# Consecutive failures before a backend's circuit opens, and seconds between probes while open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+# GETs are retried on timeouts/5xx with jittered exponential backoff
+GET_RETRIES = int(os.getenv('GET_RETRIES', '2'))
+RETRY_BACKOFF = float(os.getenv('RETRY_BACKOFF', '0.25'))
+# Overall limit for a GET including its retries and hedge, so a hung backend costs one timeout
+GET_DEADLINE = float(os.getenv('GET_DEADLINE', str(ARR_TIMEOUT)))
+# Send a second copy of a GET that has not answered after this many seconds (0 disables)
+HEDGE_DELAY = float(os.getenv('HEDGE_DELAY', '1.5'))
+
+# Poster Thumbnails (search results)
+POSTERS_ENABLED = os.getenv('POSTERS_ENABLED', 'true').lower() == 'true'
+POSTER_CACHE_DIR = os.path.join(DATA_DIR, 'posters')
+# Downscaled posters kept on disk; least recently shown are evicted first
+POSTER_CACHE_MAX_MB = int(os.getenv('POSTER_CACHE_MAX_MB', '200'))
+POSTER_MAX_WIDTH = int(os.getenv('POSTER_MAX_WIDTH', '300'))
+POSTER_MAX_HEIGHT = int(os.getenv('POSTER_MAX_HEIGHT', '450'))
+POSTER_FETCH_CONCURRENCY = int(os.getenv('POSTER_FETCH_CONCURRENCY', '4'))
+# Search replies wait at most this long for posters; slower ones are cached for next time
+POSTER_WAIT = float(os.getenv('POSTER_WAIT', '2'))
+
+# Inline Mode (@bot <title> from any chat; enable it with @BotFather's /setinline)
+# A lookup starts once the user stops typing for INLINE_DEBOUNCE seconds
+INLINE_DEBOUNCE = float(os.getenv('INLINE_DEBOUNCE', '0.4'))
+INLINE_MIN_QUERY = int(os.getenv('INLINE_MIN_QUERY', '3'))
+# Seconds Telegram may serve an answer from its own cache without asking the bot
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '300'))
+
+# Missing Search (re-searches monitored episodes/movies that still have no file)
+MISSING_SEARCH_ENABLED = os.getenv('MISSING_SEARCH_ENABLED', 'true').lower() == 'true'
+MISSING_SEARCH_PATH = os.path.join(DATA_DIR, 'missing_search.db')
+# Seconds between rounds; each round searches up to MISSING_SEARCH_BATCH_SIZE items
+MISSING_SEARCH_INTERVAL = int(os.getenv('MISSING_SEARCH_INTERVAL', '600'))
+MISSING_SEARCH_BATCH_SIZE = int(os.getenv('MISSING_SEARCH_BATCH_SIZE', '10'))
+# Items searched per hour across all instances, to stay within indexer API limits
+MISSING_SEARCH_PER_HOUR = int(os.getenv('MISSING_SEARCH_PER_HOUR', '30'))
+# Hours before an item is searched again, doubling after each search that found nothing
+MISSING_SEARCH_RETRY_HOURS = float(os.getenv('MISSING_SEARCH_RETRY_HOURS', '24'))
+# Titles requested within this many days are searched first
+MISSING_SEARCH_PRIORITY_DAYS = float(os.getenv('MISSING_SEARCH_PRIORITY_DAYS', '14'))
+
+# Bulk Add (/addlist)
+BULK_ADD_CONCURRENCY = int(os.getenv('BULK_ADD_CONCURRENCY', '4'))
+BULK_ADD_MAX_ENTRIES = int(os.getenv('BULK_ADD_MAX_ENTRIES', '100'))
+# Upstream calls per second for a user's /addlist, separate from their USER_RATE_LIMIT;
+# a plain title costs about three (two lookups and the add)
+BULK_ADD_RATE_LIMIT = float(os.getenv('BULK_ADD_RATE_LIMIT', '3'))
+BULK_ADD_RATE_BURST = int(os.getenv('BULK_ADD_RATE_BURST', '12'))
+
 # Validate required configuration
 def validate_config():
     """Validate that all required configuration is present"""
@@ -35,5 +176,30 @@ def validate_config():
     if not RADARR_API_KEY:
         errors.append("RADARR_API_KEY is not set")
 
+    for service, instances in (('SONARR', SONARR_INSTANCES), ('RADARR', RADARR_INSTANCES)):
+        names = [instance['name'] for instance in instances]
+        for instance in instances[1:]:
+            prefix = f"{service}_{instance['name'].upper()}"
+            # Instance names travel in button callback data, which Telegram caps at 64 bytes
+            if not instance['name'].isalnum() or len(instance['name']) > 16 or instance['name'] == 'default':
+                errors.append(
+                    f"{service}_INSTANCES: '{instance['name']}' must be up to 16 letters/digits "
+                    f"and not 'default'"
+                )
+            if not instance['url']:
+                errors.append(f"{prefix}_URL is not set")
+            if not instance['api_key']:
+                errors.append(f"{prefix}_API_KEY is not set")
+        if len(set(names)) != len(names):
+            errors.append(f"{service}_INSTANCES lists an instance twice")
+
+    if TELEGRAM_MODE not in ('polling', 'webhook'):
+        errors.append("TELEGRAM_MODE must be 'polling' or 'webhook'")
+
+    if TELEGRAM_MODE == 'webhook' and not WEBHOOK_URL:
+        errors.append("WEBHOOK_URL is not set (required when TELEGRAM_MODE=webhook)")
+    if TELEGRAM_MODE == 'webhook' and not WEBHOOK_SECRET_TOKEN:
+        errors.append("WEBHOOK_SECRET_TOKEN is not set (required when TELEGRAM_MODE=webhook)")
+
     if errors:
         raise ValueError(f"Configuration errors: {', '.join(errors)}")
@@ -0,0 +1,116 @@
+"""
+Debounced lookups for inline mode (@bot <title> from any chat)
+
+Telegram sends an inline query for every keystroke. Each user's newest
+query supersedes the previous one: a superseded query is dropped while it
+waits out the debounce, or its upstream lookup is cancelled if already
+running. Results are remembered per query, so a query that extends an
+earlier one can be answered by filtering the earlier results locally.
+"""
+import asyncio
+import logging
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from cache import AsyncLRUCache
+from title_index import WORD_RE
+
+logger = logging.getLogger(__name__)
+
+Result = Tuple[str, Dict]  # ('show' | 'movie', lookup record)
+
+# A lookup with this many matches of one kind may have been cut short upstream
+# (e.g. for 'the'), so narrower queries are not answered from it
+COMPLETE_BELOW = 10
+
+
+def title_matches(term: str, title: str) -> bool:
+    """True if every word of term starts some word of title ('breaking ba' ~ 'Breaking Bad')"""
+    title_words = WORD_RE.findall(title.casefold())
+    return all(
+        any(title_word.startswith(word) for title_word in title_words)
+        for word in WORD_RE.findall(term)
+    )
+
+
+class InlineSearch:
+    """
+    Per-user debounced, cancellable lookups with prefix reuse
+
+    ``lookup(term)`` runs the upstream searches for a normalized term and
+    returns (kind, record) pairs. A lookup starts only after the user has
+    stopped typing for ``debounce`` seconds. If the longest earlier term
+    that prefixes the new one returned a complete list (fewer than
+    COMPLETE_BELOW matches of each kind), its results whose titles still
+    match are returned without a lookup.
+    """
+
+    def __init__(self, lookup: Callable[[str], Awaitable[List[Result]]], debounce: float,
+                 min_length: int = 3, cache_size: int = 512, ttl: float = 900):
+        self.lookup = lookup
+        self.debounce = debounce
+        self.min_length = min_length
+        self._results = AsyncLRUCache(cache_size, ttl)
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self.lookups = 0
+        self.reused = 0
+        self.superseded = 0
+
+    def _reuse(self, term: str) -> Optional[List[Result]]:
+        cached = self._results.get(term)
+        if cached is not None:
+            return cached[0]
+        for end in range(len(term) - 1, self.min_length - 1, -1):
+            cached = self._results.get(term[:end])
+            if cached is not None:
+                # Only the longest known prefix counts: shorter ones are broader and less relevant
+                results, complete = cached
+                if not complete:
+                    return None
+                matches = [result for result in results if title_matches(term, result[1].get('title', ''))]
+                return matches or None
+        return None
+
+    async def _debounced(self, term: str) -> List[Result]:
+        await asyncio.sleep(self.debounce)
+        self.lookups += 1
+        results = await self.lookup(term)
+        kinds = Counter(kind for kind, _ in results)
+        self._results.set(term, (results, all(count < COMPLETE_BELOW for count in kinds.values())))
+        return results
+
+    async def search(self, user_id: int, term: str) -> Optional[List[Result]]:
+        """
+        Results for a user's normalized inline query
+
+        Returns None if a newer query from the same user superseded this
+        one; lookup errors are raised.
+        """
+        previous = self._tasks.pop(user_id, None)
+        if previous is not None and not previous.done():
+            previous.cancel()
+            self.superseded += 1
+
+        reused = self._reuse(term)
+        if reused is not None:
+            self.reused += 1
+            return reused
+
+        task = asyncio.ensure_future(self._debounced(term))
+        self._tasks[user_id] = task
+        try:
+            # Waited on rather than awaited, so cancelling the task does not look like cancelling the caller
+            await asyncio.wait([task])
+        finally:
+            if self._tasks.get(user_id) is task:
+                del self._tasks[user_id]
+        if task.cancelled():
+            return None
+        return task.result()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'lookups': self.lookups,
+            'reused': self.reused,
+            'superseded': self.superseded,
+            'pending': len(self._tasks),
+        }
@@ -0,0 +1,75 @@
+"""
+Pools of named Sonarr/Radarr instances (e.g. 1080p, 4K, anime)
+"""
+import asyncio
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+class InstancePool:
+    """
+    Named clients of one service, with routing rules for adds
+
+    Every pool has a 'default' instance. Other instances are chosen when
+    a user asks for them by name, or when a title's genres match the
+    instance's configured genres (e.g. anime). Each client keeps its own
+    connection pool, cached defaults, lookup cache and circuit breaker.
+    """
+
+    def __init__(self, clients: Dict[str, object], genres: Optional[Dict[str, List[str]]] = None):
+        self.clients = clients
+        self.genres = {
+            name: {genre.casefold() for genre in instance_genres}
+            for name, instance_genres in (genres or {}).items() if instance_genres
+        }
+
+    @classmethod
+    def from_config(cls, client_class: Callable, instances: List[Dict]) -> 'InstancePool':
+        """Build a pool from config.SONARR_INSTANCES / config.RADARR_INSTANCES"""
+        clients = {
+            instance['name']: client_class(instance['url'], instance['api_key'], instance=instance['name'])
+            for instance in instances
+        }
+        return cls(clients, {instance['name']: instance['genres'] for instance in instances})
+
+    @property
+    def default(self):
+        """Lookups go here: title metadata is the same on every instance"""
+        return self.clients['default']
+
+    @property
+    def names(self) -> List[str]:
+        return list(self.clients)
+
+    def __getitem__(self, name: str):
+        return self.clients[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.clients
+
+    def __iter__(self) -> Iterator:
+        return iter(self.clients.values())
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def route(self, record: Optional[Dict], requested: Optional[str] = None) -> str:
+        """
+        Name of the instance a title should be added to
+
+        An explicitly requested instance wins, then the first instance whose
+        genres overlap the title's, then 'default'.
+        """
+        if requested in self.clients:
+            return requested
+        title_genres = {genre.casefold() for genre in (record or {}).get('genres') or ()}
+        for name, genres in self.genres.items():
+            if genres & title_genres:
+                return name
+        return 'default'
+
+    def stats_sources(self, attribute: str) -> Dict[str, Callable]:
+        """stats() of one per-client component, keyed by backend label for register_stats"""
+        return {client.backend_label: getattr(client, attribute).stats for client in self}
+
+    async def close(self):
+        await asyncio.gather(*(client.close() for client in self))
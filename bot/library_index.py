@@ -0,0 +1,483 @@
+"""
+Local on-disk index of the Sonarr/Radarr libraries
+
+Library commands read from this SQLite index instead of downloading the
+full series/movie list on demand. A background task keeps it in sync,
+and because the index lives on disk a restarted bot answers from the
+last snapshot straight away.
+
+Rows are tagged with the Sonarr/Radarr instance they came from (see
+instances.InstancePool), so one index covers every instance and
+"already in the library" checks see all of them at once.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# row_id is the index's own key; id is the Sonarr/Radarr ID, unique only within an instance
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS shows (
+    row_id INTEGER PRIMARY KEY,
+    instance TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    tvdb_id INTEGER,
+    title TEXT NOT NULL,
+    sort_title TEXT NOT NULL,
+    year INTEGER,
+    status TEXT,
+    monitored INTEGER NOT NULL DEFAULT 1,
+    UNIQUE (instance, id)
+);
+CREATE INDEX IF NOT EXISTS shows_sort ON shows (sort_title, row_id);
+CREATE INDEX IF NOT EXISTS shows_tvdb ON shows (tvdb_id);
+CREATE INDEX IF NOT EXISTS shows_status ON shows (status, sort_title, row_id);
+
+CREATE TABLE IF NOT EXISTS movies (
+    row_id INTEGER PRIMARY KEY,
+    instance TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    tmdb_id INTEGER,
+    title TEXT NOT NULL,
+    sort_title TEXT NOT NULL,
+    year INTEGER,
+    has_file INTEGER NOT NULL DEFAULT 0,
+    monitored INTEGER NOT NULL DEFAULT 1,
+    available INTEGER NOT NULL DEFAULT 1,
+    UNIQUE (instance, id)
+);
+CREATE INDEX IF NOT EXISTS movies_sort ON movies (sort_title, row_id);
+CREATE INDEX IF NOT EXISTS movies_tmdb ON movies (tmdb_id);
+CREATE INDEX IF NOT EXISTS movies_has_file ON movies (has_file, sort_title, row_id);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    library TEXT NOT NULL,
+    instance TEXT NOT NULL,
+    synced_at REAL NOT NULL,
+    PRIMARY KEY (library, instance)
+);
+"""
+
+# Columns of show_row()/movie_row(), i.e. the stored columns after row_id and instance
+SHOW_COLUMNS = ('id', 'tvdb_id', 'title', 'sort_title', 'year', 'status', 'monitored')
+MOVIE_COLUMNS = ('id', 'tmdb_id', 'title', 'sort_title', 'year', 'has_file', 'monitored', 'available')
+
+# Rows written per transaction while applying a streamed listing
+SYNC_BATCH_SIZE = 500
+
+# Filters accepted by /myshows and /mymovies, as SQL conditions on each table
+FILTERS = {
+    'shows': {
+        'all': '1',
+        'continuing': "status = 'continuing'",
+        'ended': "status = 'ended'",
+        'upcoming': "status = 'upcoming'",
+    },
+    'movies': {
+        'all': '1',
+        'missing': 'has_file = 0',
+        'downloaded': 'has_file = 1',
+    },
+}
+
+
+def show_row(series: Dict) -> Tuple:
+    """Project a Sonarr series record onto the shows table columns"""
+    title = series.get('title') or 'Unknown'
+    return (
+        series['id'],
+        series.get('tvdbId'),
+        title,
+        (series.get('sortTitle') or title).casefold(),
+        series.get('year'),
+        series.get('status'),
+        int(bool(series.get('monitored', True)))
+    )
+
+
+def movie_row(movie: Dict) -> Tuple:
+    """Project a Radarr movie record onto the movies table columns"""
+    title = movie.get('title') or 'Unknown'
+    return (
+        movie['id'],
+        movie.get('tmdbId'),
+        title,
+        (movie.get('sortTitle') or title).casefold(),
+        movie.get('year'),
+        int(bool(movie.get('hasFile'))),
+        int(bool(movie.get('monitored', True))),
+        int(bool(movie.get('isAvailable', True)))
+    )
+
+
+class LibraryIndex:
+    """
+    SQLite-backed index holding only the library fields the bot displays
+
+    Listeners registered with add_listener() are called on the event loop
+    with (table, written rows, removed row IDs) whenever the index changes.
+    Rows are full table rows: (row_id, instance, *SHOW_COLUMNS/MOVIE_COLUMNS).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._migrate()
+            self._conn.executescript(SCHEMA)
+        # Reads get their own connection, so under WAL they never wait for a sync batch to commit
+        self._read_lock = threading.Lock()
+        self._read_conn = sqlite3.connect(path, check_same_thread=False)
+        self._read_conn.row_factory = sqlite3.Row
+        self._listeners: List[Callable[[str, List[Tuple], List[int]], None]] = []
+        self._sync_requested = asyncio.Event()
+        # Set by run_sync(): library -> InstancePool it syncs from
+        self._pools: Dict[str, object] = {}
+        # (library, instance) -> monotonic time its last sync started, and pairs queued by request_sync()
+        self._sync_attempted: Dict[Tuple[str, str], float] = {}
+        self._sync_pending: Set[Tuple[str, str]] = set()
+
+    def _migrate(self):
+        """Drop tables from before instances existed and add newer columns; the next sync fills them"""
+        for table in ('shows', 'movies', 'sync_state'):
+            columns = [row[1] for row in self._conn.execute(f'PRAGMA table_info({table})')]
+            if columns and 'instance' not in columns:
+                logger.info(f"Library index: rebuilding {table} with instance support")
+                self._conn.execute(f'DROP TABLE {table}')
+            elif table == 'movies' and columns and 'available' not in columns:
+                self._conn.execute('ALTER TABLE movies ADD COLUMN available INTEGER NOT NULL DEFAULT 1')
+
+    def add_listener(self, listener: Callable[[str, List[Tuple], List[int]], None]):
+        """Register a change listener and replay the current contents to it"""
+        self._listeners.append(listener)
+        for table in ('shows', 'movies'):
+            listener(table, [tuple(row) for row in self._query(f'SELECT * FROM {table}')], [])
+
+    def _notify(self, table: str, rows: List[Tuple], removed_ids: List[int]):
+        if rows or removed_ids:
+            for listener in self._listeners:
+                listener(table, rows, removed_ids)
+
+    def close(self):
+        with self._lock, self._read_lock:
+            self._conn.close()
+            self._read_conn.close()
+
+    # Reads
+
+    def _query(self, sql: str, params: Iterable = ()) -> List[sqlite3.Row]:
+        with self._read_lock:
+            return self._read_conn.execute(sql, tuple(params)).fetchall()
+
+    def synced_at(self, library: str, instance: Optional[str] = None) -> Optional[float]:
+        """
+        Timestamp of the last completed sync of 'shows' or 'movies'
+
+        Without ``instance`` this is the oldest sync across instances.
+        """
+        if instance is None:
+            return self._query('SELECT MIN(synced_at) FROM sync_state WHERE library = ?', (library,))[0][0]
+        rows = self._query(
+            'SELECT synced_at FROM sync_state WHERE library = ? AND instance = ?', (library, instance)
+        )
+        return rows[0]['synced_at'] if rows else None
+
+    def request_sync(self, library: str, max_age: float):
+        """
+        Have run_sync() refresh the instances of 'shows' or 'movies' whose snapshot is older than max_age
+
+        An instance is skipped while its circuit breaker is open, and is
+        not tried again within max_age of its last attempt, so a failing
+        instance does not turn every view into a sync.
+        """
+        pool = self._pools.get(library)
+        if pool is None:
+            return
+        now = time.time()
+        for client in pool:
+            key = (library, client.instance)
+            synced_at = self.synced_at(library, client.instance)
+            if synced_at is not None and now - synced_at <= max_age:
+                continue
+            attempted = self._sync_attempted.get(key)
+            if client.breaker.is_open or (attempted is not None and time.monotonic() - attempted < max_age):
+                continue
+            self._sync_pending.add(key)
+            self._sync_requested.set()
+
+    def count(self, library: str, filter_name: str = 'all') -> int:
+        where = FILTERS[library][filter_name]
+        return self._query(f'SELECT COUNT(*) FROM {library} WHERE {where}')[0][0]
+
+    def page(self, library: str, filter_name: str = 'all', after: Optional[int] = None,
+             before: Optional[int] = None, limit: int = 20) -> Tuple[List[sqlite3.Row], int, bool, bool]:
+        """
+        Fetch one page in sort-title order using a keyset cursor
+
+        ``after``/``before`` are the row IDs of the last/first row of the
+        neighbouring page, so each page reads only the rows it shows via
+        the (sort_title, row_id) indexes. Returns (rows, offset of the first
+        row, has previous page, has next page).
+        """
+        where = FILTERS[library][filter_name]
+        cursor_id = after if after is not None else before
+        key = None
+        if cursor_id is not None:
+            key = self._query(f'SELECT sort_title, row_id FROM {library} WHERE row_id = ?', (cursor_id,))
+        if not key:
+            # No cursor, or the row it pointed at is gone: start from the top
+            rows = self._query(
+                f'SELECT * FROM {library} WHERE {where} ORDER BY sort_title, row_id LIMIT ?',
+                (limit + 1,)
+            )
+            return rows[:limit], 0, False, len(rows) > limit
+
+        sort_title, row_id = key[0]
+        if after is not None:
+            rows = self._query(
+                f'SELECT * FROM {library} WHERE {where} AND (sort_title, row_id) > (?, ?) '
+                f'ORDER BY sort_title, row_id LIMIT ?',
+                (sort_title, row_id, limit + 1)
+            )
+            has_prev, has_next = True, len(rows) > limit
+            rows = rows[:limit]
+        else:
+            rows = self._query(
+                f'SELECT * FROM {library} WHERE {where} AND (sort_title, row_id) < (?, ?) '
+                f'ORDER BY sort_title DESC, row_id DESC LIMIT ?',
+                (sort_title, row_id, limit + 1)
+            )
+            has_prev, has_next = len(rows) > limit, True
+            rows = list(reversed(rows[:limit]))
+
+        if not rows:
+            return rows, 0, has_prev, has_next
+        offset = self._query(
+            f'SELECT COUNT(*) FROM {library} WHERE {where} AND (sort_title, row_id) < (?, ?)',
+            (rows[0]['sort_title'], rows[0]['row_id'])
+        )[0][0]
+        return rows, offset, has_prev, has_next
+
+    def has_show(self, tvdb_id: int, instance: Optional[str] = None) -> bool:
+        """Whether any instance (or the given one) has the series"""
+        return self._has('shows', 'tvdb_id', tvdb_id, instance)
+
+    def has_movie(self, tmdb_id: int, instance: Optional[str] = None) -> bool:
+        """Whether any instance (or the given one) has the movie"""
+        return self._has('movies', 'tmdb_id', tmdb_id, instance)
+
+    def missing_movies(self, instance: str) -> List[Tuple[int, int]]:
+        """(Radarr ID, TMDB ID) of an instance's monitored, released movies without a file"""
+        return [
+            tuple(row) for row in self._query(
+                'SELECT id, tmdb_id FROM movies '
+                'WHERE instance = ? AND monitored = 1 AND has_file = 0 AND available = 1',
+                (instance,)
+            )
+        ]
+
+    def tvdb_ids(self, instance: str) -> Dict[int, int]:
+        """Sonarr series ID -> TVDB ID for one instance"""
+        rows = self._query('SELECT id, tvdb_id FROM shows WHERE instance = ?', (instance,))
+        return {row['id']: row['tvdb_id'] for row in rows}
+
+    def _has(self, table: str, column: str, external_id: int, instance: Optional[str]) -> bool:
+        if instance is None:
+            return bool(self._query(f'SELECT 1 FROM {table} WHERE {column} = ? LIMIT 1', (external_id,)))
+        return bool(self._query(
+            f'SELECT 1 FROM {table} WHERE {column} = ? AND instance = ? LIMIT 1', (external_id, instance)
+        ))
+
+    # Writes
+
+    def upsert_show(self, series: Dict, instance: str = 'default'):
+        """Record a single series, e.g. right after it was added"""
+        self._notify('shows', self._write('shows', instance, SHOW_COLUMNS, [show_row(series)]), [])
+
+    def upsert_movie(self, movie: Dict, instance: str = 'default'):
+        """Record a single movie, e.g. right after it was added"""
+        self._notify('movies', self._write('movies', instance, MOVIE_COLUMNS, [movie_row(movie)]), [])
+
+    def _write(self, table: str, instance: str, columns: Tuple[str, ...], rows: List[Tuple]) -> List[Tuple]:
+        """
+        Insert or update rows of one instance, returning the full stored rows
+
+        Updates happen in place, so a row keeps its row_id (and any paging
+        cursor pointing at it stays valid).
+        """
+        if not rows:
+            return []
+        placeholders = ', '.join('?' for _ in range(len(columns) + 1))
+        updates = ', '.join(f'{column} = excluded.{column}' for column in columns[1:])
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f'INSERT INTO {table} (instance, {", ".join(columns)}) VALUES ({placeholders}) '
+                f'ON CONFLICT (instance, id) DO UPDATE SET {updates}',
+                [(instance,) + row for row in rows]
+            )
+            ids = [row[0] for row in rows]
+            return [
+                tuple(row) for row in self._conn.execute(
+                    f'SELECT * FROM {table} WHERE instance = ? AND id IN ({", ".join("?" for _ in ids)})',
+                    [instance] + ids
+                )
+            ]
+
+    def apply_rows(self, table: str, instance: str, columns: Tuple[str, ...], rows: List[Tuple]) -> List[Tuple]:
+        """
+        Write the rows of one sync batch that differ from what is stored
+
+        Unchanged rows are skipped, so a steady-state sync touches almost
+        nothing on disk. Returns the full rows that were written.
+        """
+        ids = [row[0] for row in rows]
+        existing = {
+            row[0]: tuple(row)
+            for row in self._query(
+                f'SELECT {", ".join(columns)} FROM {table} '
+                f'WHERE instance = ? AND id IN ({", ".join("?" for _ in ids)})',
+                [instance] + ids
+            )
+        }
+        return self._write(table, instance, columns, [row for row in rows if existing.get(row[0]) != row])
+
+    def finish_snapshot(self, table: str, instance: str, seen_ids: Set[int]) -> List[int]:
+        """Delete the instance's rows that were not in the listing and stamp the sync time"""
+        with self._lock, self._conn:
+            removed = [
+                row_id for row_id, item_id in self._conn.execute(
+                    f'SELECT row_id, id FROM {table} WHERE instance = ?', (instance,)
+                )
+                if item_id not in seen_ids
+            ]
+            if removed:
+                self._conn.executemany(f'DELETE FROM {table} WHERE row_id = ?', [(row_id,) for row_id in removed])
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sync_state (library, instance, synced_at) VALUES (?, ?, ?)',
+                (table, instance, time.time())
+            )
+        return removed
+
+    def prune_instances(self, table: str, instances: Iterable[str]) -> List[int]:
+        """Delete rows of instances that are no longer configured; returns their row IDs"""
+        instances = list(instances)
+        placeholders = ', '.join('?' for _ in instances)
+        with self._lock, self._conn:
+            removed = [
+                row[0] for row in self._conn.execute(
+                    f'SELECT row_id FROM {table} WHERE instance NOT IN ({placeholders})', instances
+                )
+            ]
+            if removed:
+                self._conn.executemany(f'DELETE FROM {table} WHERE row_id = ?', [(row_id,) for row_id in removed])
+            self._conn.execute(
+                f'DELETE FROM sync_state WHERE library = ? AND instance NOT IN ({placeholders})',
+                [table] + instances
+            )
+        return removed
+
+    # Background sync
+
+    async def _sync_table(self, table: str, instance: str, columns: Tuple[str, ...],
+                          rows: AsyncIterator[Tuple]):
+        """
+        Apply one instance's streamed upstream listing in fixed-size batches
+
+        Only the current batch and the set of seen IDs are held in memory,
+        however large the library is.
+        """
+        written = 0
+        seen_ids = set()
+        batch = []
+        async for row in rows:
+            seen_ids.add(row[0])
+            batch.append(row)
+            if len(batch) >= SYNC_BATCH_SIZE:
+                written += await self._apply_batch(table, instance, columns, batch)
+                batch = []
+        if batch:
+            written += await self._apply_batch(table, instance, columns, batch)
+        removed = await asyncio.to_thread(self.finish_snapshot, table, instance, seen_ids)
+        self._notify(table, [], removed)
+        logger.info(
+            f"Library index: {table} of {instance} synced ({written} updated, {len(removed)} removed)"
+        )
+
+    async def _apply_batch(self, table: str, instance: str, columns: Tuple[str, ...], batch: List[Tuple]) -> int:
+        changed = await asyncio.to_thread(self.apply_rows, table, instance, columns, batch)
+        self._notify(table, changed, [])
+        return len(changed)
+
+    async def sync_shows(self, sonarr):
+        """Sync one Sonarr instance"""
+        await self._sync_table('shows', sonarr.instance, SHOW_COLUMNS, sonarr.stream_series(show_row))
+
+    async def sync_movies(self, radarr):
+        """Sync one Radarr instance"""
+        await self._sync_table('movies', radarr.instance, MOVIE_COLUMNS, radarr.stream_movies(movie_row))
+
+    async def _sync_instance(self, library: str, client):
+        self._sync_attempted[(library, client.instance)] = time.monotonic()
+        if library == 'shows':
+            await self.sync_shows(client)
+        else:
+            await self.sync_movies(client)
+
+    async def run_sync(self, sonarr, radarr, interval: float):
+        """
+        Keep both tables in sync with every instance of the two pools until cancelled
+
+        Instances are synced concurrently; one failing leaves the others'
+        rows current. Every ``interval`` seconds all instances are synced;
+        in between, only the instances queued by request_sync() are. If
+        the snapshot on disk is still fresh for every instance at startup,
+        the first full sync waits until it is due instead of running
+        immediately.
+        """
+        self._pools = {'shows': sonarr, 'movies': radarr}
+        for table, pool in self._pools.items():
+            self._notify(table, [], self.prune_instances(table, pool.names))
+
+        next_full = time.monotonic()
+        synced = [self.synced_at('shows', name) for name in sonarr.names]
+        synced += [self.synced_at('movies', name) for name in radarr.names]
+        if all(synced):
+            delay = max(0.0, interval - (time.time() - min(synced)))
+            if delay:
+                logger.info(f"Library index is warm, next sync in {delay:.0f}s")
+                next_full += delay
+
+        while True:
+            timeout = next_full - time.monotonic()
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(self._sync_requested.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            self._sync_requested.clear()
+            full = time.monotonic() >= next_full
+            if full:
+                targets = [(table, client) for table, pool in self._pools.items() for client in pool]
+            else:
+                targets = [(table, self._pools[table][name]) for table, name in sorted(self._sync_pending)]
+            self._sync_pending.clear()
+
+            results = await asyncio.gather(
+                *(self._sync_instance(table, client) for table, client in targets), return_exceptions=True
+            )
+            for (table, client), result in zip(targets, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Library index sync of {client.display_name} failed: {result}")
+            if full:
+                next_full = time.monotonic() + interval
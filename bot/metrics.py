@@ -0,0 +1,125 @@
+"""
+Prometheus metrics for handlers, upstream calls and Telegram API calls
+
+Served at /metrics by web_server. Per-call work is a histogram observe
+and two gauge updates; cache and queue statistics are only read when
+/metrics is scraped.
+"""
+import functools
+import re
+import time
+from typing import Callable, Dict, Iterable
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from telegram.request import HTTPXRequest
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HANDLER_LATENCY = Histogram(
+    'zuliantv_handler_seconds', 'Time spent in each bot handler', ['handler'], buckets=LATENCY_BUCKETS
+)
+HANDLER_ERRORS = Counter(
+    'zuliantv_handler_errors_total', 'Handler calls that raised', ['handler']
+)
+HANDLER_IN_FLIGHT = Gauge(
+    'zuliantv_handler_in_flight', 'Handler calls currently running', ['handler']
+)
+
+UPSTREAM_LATENCY = Histogram(
+    'zuliantv_upstream_seconds', 'Sonarr/Radarr request latency', ['backend', 'method', 'endpoint'],
+    buckets=LATENCY_BUCKETS
+)
+UPSTREAM_ERRORS = Counter(
+    'zuliantv_upstream_errors_total', 'Failed Sonarr/Radarr requests', ['backend', 'method', 'endpoint']
+)
+UPSTREAM_IN_FLIGHT = Gauge(
+    'zuliantv_upstream_in_flight', 'Sonarr/Radarr requests currently running', ['backend']
+)
+
+TELEGRAM_LATENCY = Histogram(
+    'zuliantv_telegram_seconds', 'Telegram Bot API call latency', ['method'], buckets=LATENCY_BUCKETS
+)
+TELEGRAM_ERRORS = Counter(
+    'zuliantv_telegram_errors_total', 'Failed Telegram Bot API calls', ['method']
+)
+
+ID_SEGMENT_RE = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_label(endpoint: str) -> str:
+    """Collapse an endpoint to a low-cardinality label: 'movie/123?x=1' -> 'movie/{id}'"""
+    return ID_SEGMENT_RE.sub('/{id}', endpoint.split('?', 1)[0])
+
+
+def instrument_handler(callback: Callable) -> Callable:
+    """Wrap a PTB handler callback with latency, error and in-flight metrics"""
+    name = callback.__name__
+    latency = HANDLER_LATENCY.labels(name)
+    errors = HANDLER_ERRORS.labels(name)
+    in_flight = HANDLER_IN_FLIGHT.labels(name)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context):
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            latency.observe(time.perf_counter() - started)
+            in_flight.dec()
+
+    return wrapper
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """PTB request backend that times every Bot API call by method name"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            return await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            TELEGRAM_ERRORS.labels(api_method).inc()
+            raise
+        finally:
+            TELEGRAM_LATENCY.labels(api_method).observe(time.perf_counter() - started)
+
+
+class StatsCollector:
+    """
+    Exposes stats() dictionaries (caches, limiters) at scrape time
+
+    ``sources`` maps a backend label to a callable returning a stats dict;
+    keys listed in ``counters`` are exported as counters, the rest as gauges.
+    """
+
+    def __init__(self, prefix: str, sources: Dict[str, Callable[[], Dict[str, float]]],
+                 counters: Iterable[str] = ()):
+        self.prefix = prefix
+        self.sources = sources
+        self.counters = set(counters)
+
+    def collect(self):
+        families = {}
+        for backend, stats in self.sources.items():
+            for key, value in stats().items():
+                family = families.get(key)
+                if family is None:
+                    name = f'zuliantv_{self.prefix}_{key}'
+                    if key in self.counters:
+                        family = CounterMetricFamily(name, f'{self.prefix} {key}', labels=['backend'])
+                    else:
+                        family = GaugeMetricFamily(name, f'{self.prefix} {key}', labels=['backend'])
+                    families[key] = family
+                family.add_metric([backend], value)
+        return list(families.values())
+
+
+def register_stats(prefix: str, sources: Dict[str, Callable[[], Dict[str, float]]],
+                   counters: Iterable[str] = ()):
+    """Publish stats() callables under zuliantv_<prefix>_<key>{backend=...}"""
+    REGISTRY.register(StatsCollector(prefix, sources, counters))
@@ -0,0 +1,265 @@
+"""
+Paced background searches for monitored titles that are still missing
+
+Sonarr/Radarr grab new releases as they show up in indexer RSS feeds, so
+a title whose first search found nothing stays missing until someone
+searches again. This scheduler does that a small batch at a time, within
+an hourly budget that indexers tolerate. Missing movies come from the
+library index, missing episodes from Sonarr's wanted list, and each
+round's IDs go out as one EpisodeSearch/MoviesSearch command per
+instance. When each item was last searched is kept on disk, so neither
+the budget nor the sweep starts over after a restart.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from activity import parse_time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    kind TEXT NOT NULL,
+    instance TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    searched_at REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    PRIMARY KEY (kind, instance, item_id)
+);
+CREATE INDEX IF NOT EXISTS searches_time ON searches (searched_at);
+"""
+
+# Episodes per wanted/missing page, and the most considered per instance and round
+MISSING_PAGE_SIZE = 1000
+MAX_MISSING_EPISODES = 10000
+
+# Unsuccessful searches double the wait before the next one, up to this many times retry_after
+MAX_BACKOFF = 32
+
+# Seconds the per-hour budget covers
+BUDGET_WINDOW = 3600
+
+
+class Candidate(NamedTuple):
+    kind: str  # 'episode' | 'movie'
+    instance: str
+    item_id: int  # Sonarr episode ID / Radarr movie ID
+    media_id: Optional[int]  # TVDB ID of the series / TMDB ID
+    aired: float  # air date as a timestamp, 0 if unknown
+
+
+class MissingSearch:
+    """
+    Searches missing monitored episodes and movies within an indexer budget
+
+    Every ``interval`` seconds a round searches at most ``batch_size``
+    items, and never more than ``per_hour`` within an hour. Titles
+    requested in the last ``priority_window`` seconds go first (newest
+    request first), then items never searched, then those searched
+    longest ago. An item is searched again ``retry_after`` seconds after
+    its last search, doubling after every search that did not find it.
+    Titles in the download queue are skipped.
+    """
+
+    def __init__(self, path: str, library, requests_store, sonarr, radarr, activity, interval: float,
+                 per_hour: int, batch_size: int, retry_after: float, priority_window: float):
+        self.library = library
+        self.requests_store = requests_store
+        self.sonarr = sonarr
+        self.radarr = radarr
+        self.activity = activity
+        self.interval = interval
+        self.per_hour = per_hour
+        self.batch_size = batch_size
+        self.retry_after = retry_after
+        self.priority_window = priority_window
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+        self.searched = 0
+        self.commands = 0
+        self.failures = 0
+        self.due = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Search log
+
+    def searched_within(self, seconds: float) -> int:
+        """Items searched in the last seconds, i.e. the budget already spent"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM searches WHERE searched_at > ?', (time.time() - seconds,)
+            ).fetchone()[0]
+
+    def history(self) -> Dict[Tuple[str, str, int], Tuple[float, int]]:
+        """(kind, instance, item ID) -> (last searched at, searches so far)"""
+        with self._lock:
+            return {
+                (kind, instance, item_id): (searched_at, attempts)
+                for kind, instance, item_id, searched_at, attempts in self._conn.execute(
+                    'SELECT kind, instance, item_id, searched_at, attempts FROM searches'
+                )
+            }
+
+    def record(self, kind: str, instance: str, item_ids: List[int]):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT INTO searches (kind, instance, item_id, searched_at, attempts) VALUES (?, ?, ?, ?, 1) '
+                'ON CONFLICT (kind, instance, item_id) DO UPDATE '
+                'SET searched_at = excluded.searched_at, attempts = attempts + 1',
+                [(kind, instance, item_id, now) for item_id in item_ids]
+            )
+
+    def prune(self, kind: str, instance: str, missing_ids: Set[int]):
+        """
+        Forget items of an instance that are no longer missing
+
+        Rows still counting toward the budget are kept until they age out.
+        """
+        with self._lock, self._conn:
+            found = [
+                (kind, instance, item_id) for (item_id,) in self._conn.execute(
+                    'SELECT item_id FROM searches WHERE kind = ? AND instance = ? AND searched_at < ?',
+                    (kind, instance, time.time() - BUDGET_WINDOW)
+                )
+                if item_id not in missing_ids
+            ]
+            if found:
+                self._conn.executemany(
+                    'DELETE FROM searches WHERE kind = ? AND instance = ? AND item_id = ?', found
+                )
+
+    # Candidates
+
+    async def _missing_episodes(self, client) -> Tuple[List[Candidate], bool]:
+        """An instance's missing episodes, newest first, and whether the list is complete"""
+        tvdb_ids = await asyncio.to_thread(self.library.tvdb_ids, client.instance)
+        candidates = []
+        page = 1
+        while True:
+            result = await client.get_missing_episodes(page, MISSING_PAGE_SIZE)
+            records = result.get('records') or []
+            for record in records:
+                aired = parse_time(record.get('airDateUtc'))
+                candidates.append(Candidate(
+                    'episode', client.instance, record['id'], tvdb_ids.get(record.get('seriesId')),
+                    aired.timestamp() if aired else 0
+                ))
+            if len(records) < MISSING_PAGE_SIZE or page * MISSING_PAGE_SIZE >= (result.get('totalRecords') or 0):
+                return candidates, True
+            if len(candidates) >= MAX_MISSING_EPISODES:
+                return candidates, False
+            page += 1
+
+    async def _missing_movies(self, client) -> Tuple[List[Candidate], bool]:
+        rows = await asyncio.to_thread(self.library.missing_movies, client.instance)
+        return [Candidate('movie', client.instance, movie_id, tmdb_id, 0) for movie_id, tmdb_id in rows], True
+
+    async def candidates(self) -> List[Candidate]:
+        """Missing items of every instance; an instance that cannot be listed is skipped this round"""
+        listings = [(client, 'episode', self._missing_episodes(client)) for client in self.sonarr]
+        listings += [(client, 'movie', self._missing_movies(client)) for client in self.radarr]
+        results = await asyncio.gather(*(listing for _, _, listing in listings), return_exceptions=True)
+
+        candidates = []
+        for (client, kind, _), result in zip(listings, results):
+            if isinstance(result, Exception):
+                logger.warning(f"Missing search: could not list missing items of {client.display_name}: {result}")
+                continue
+            items, complete = result
+            candidates.extend(items)
+            if complete:
+                await asyncio.to_thread(self.prune, kind, client.instance, {item.item_id for item in items})
+        return candidates
+
+    def prioritize(self, candidates: List[Candidate]) -> List[Candidate]:
+        """The candidates due for a search, most important first"""
+        now = time.time()
+        since = now - self.priority_window
+        requested = {
+            'episode': self.requests_store.requested_since('show', since),
+            'movie': self.requests_store.requested_since('movie', since),
+        }
+        queued = {(entry.kind, entry.instance, entry.media_id) for entry in self.activity.queue}
+        history = self.history()
+
+        due = []
+        for candidate in candidates:
+            title_kind = 'show' if candidate.kind == 'episode' else 'movie'
+            if (title_kind, candidate.instance, candidate.media_id) in queued:
+                continue
+            searched_at, attempts = history.get((candidate.kind, candidate.instance, candidate.item_id), (0, 0))
+            if attempts and now - searched_at < self.retry_after * min(2 ** (attempts - 1), MAX_BACKOFF):
+                continue
+            requested_at = requested[candidate.kind].get(candidate.media_id, 0)
+            due.append(((-requested_at, searched_at, -candidate.aired), candidate))
+        due.sort(key=lambda item: item[0])
+        return [candidate for _, candidate in due]
+
+    # Rounds
+
+    async def run_round(self) -> int:
+        """Search the next batch within the budget; returns the number of items searched"""
+        allowance = min(self.batch_size, self.per_hour - await asyncio.to_thread(self.searched_within, BUDGET_WINDOW))
+        if allowance <= 0:
+            return 0
+        due = await asyncio.to_thread(self.prioritize, await self.candidates())
+        self.due = len(due)
+
+        # One command per instance, covering its share of the batch
+        batches: Dict[Tuple[str, str], List[int]] = {}
+        for candidate in due[:allowance]:
+            batches.setdefault((candidate.kind, candidate.instance), []).append(candidate.item_id)
+
+        searched = 0
+        for (kind, instance), item_ids in batches.items():
+            client = self.sonarr[instance] if kind == 'episode' else self.radarr[instance]
+            try:
+                if kind == 'episode':
+                    await client.search_episodes(item_ids)
+                else:
+                    await client.search_movies_by_ids(item_ids)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Missing search: {kind} search on {client.display_name} failed: {e}")
+                continue
+            await asyncio.to_thread(self.record, kind, instance, item_ids)
+            self.commands += 1
+            searched += len(item_ids)
+
+        self.searched += searched
+        if searched:
+            logger.info(f"Missing search: searched {searched} of {len(due)} due items")
+        return searched
+
+    async def run(self):
+        """Run a round every interval seconds until cancelled, starting once the library index has synced"""
+        while self.library.synced_at('shows') is None or self.library.synced_at('movies') is None:
+            await asyncio.sleep(1)
+        while True:
+            try:
+                await self.run_round()
+            except Exception as e:
+                logger.error(f"Missing search round failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'searched': self.searched,
+            'commands': self.commands,
+            'failures': self.failures,
+            'due': self.due,
+        }
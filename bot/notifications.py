@@ -0,0 +1,132 @@
+"""
+Download notifications driven by Sonarr/Radarr Connect webhooks
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from request_store import DOWNLOADED, DOWNLOADING
+
+logger = logging.getLogger(__name__)
+
+# Connect events we notify about, and the request state each one implies.
+# Everything else (Test, Rename, Health, ...) is ignored.
+EVENT_STATES = {
+    'Grab': DOWNLOADING,
+    'Download': DOWNLOADED,
+    'Upgrade': DOWNLOADED,
+}
+
+
+def format_episodes(episodes: List[Dict]) -> str:
+    """Render an episode list as 'S01E02' or a count for season packs"""
+    if not episodes:
+        return ''
+    if len(episodes) > 3:
+        return f" ({len(episodes)} episodes)"
+    codes = [
+        f"S{episode.get('seasonNumber', 0):02d}E{episode.get('episodeNumber', 0):02d}"
+        for episode in episodes
+    ]
+    return f" {', '.join(codes)}"
+
+
+def parse_event(service: str, payload: Dict) -> Optional[Tuple[str, int, str, str]]:
+    """
+    Turn a Connect webhook payload into (kind, media ID, event type, message text)
+
+    kind is 'show' (keyed by tvdbId) or 'movie' (keyed by tmdbId).
+    Returns None for events that should not produce a notification.
+    """
+    event_type = payload.get('eventType')
+    if not isinstance(event_type, str) or event_type not in EVENT_STATES:
+        return None
+    if event_type == 'Download' and payload.get('isUpgrade'):
+        event_type = 'Upgrade'
+
+    if service == 'sonarr':
+        series = payload.get('series')
+        if not isinstance(series, dict):
+            return None
+        media_id = series.get('tvdbId')
+        title = f"'{series.get('title', 'Unknown')}'{format_episodes(payload.get('episodes') or [])}"
+        kind = 'show'
+    else:
+        movie = payload.get('movie')
+        if not isinstance(movie, dict):
+            return None
+        media_id = movie.get('tmdbId')
+        title = f"'{movie.get('title', 'Unknown')}'"
+        if movie.get('year'):
+            title += f" ({movie['year']})"
+        kind = 'movie'
+
+    if not media_id:
+        return None
+
+    if event_type == 'Grab':
+        text = f"⬇️ {title} is downloading..."
+    elif event_type == 'Upgrade':
+        text = f"⬆️ {title} was upgraded to a better quality."
+    else:
+        text = f"✅ {title} is ready to watch!"
+    return kind, media_id, event_type, text
+
+
+class DownloadNotifier:
+    """
+    Routes webhook events to the Telegram users who requested each title
+
+    handle_event() only parses and enqueues, so the HTTP endpoint answers
+    immediately even during a burst; a few worker tasks drain the queue
+    and deliver messages through the injected ``send(user_id, text)``.
+    Recipients come from the request store, which is also told the new
+    state of the request.
+    """
+
+    def __init__(self, store, send: Callable[[int, str], Awaitable], workers: int = 4,
+                 queue_size: int = 1000):
+        self.store = store
+        self.send = send
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks: List[asyncio.Task] = []
+
+    def handle_event(self, service: str, payload: Dict) -> bool:
+        """
+        Queue notifications for one webhook payload without waiting on Telegram
+
+        Returns False if the queue is full and the event had to be dropped.
+        """
+        event = parse_event(service, payload)
+        if event is None:
+            return True
+
+        kind, media_id, event_type, text = event
+        self.store.set_state(kind, media_id, EVENT_STATES[event_type])
+        for user_id in self.store.requesters(kind, media_id):
+            try:
+                self.queue.put_nowait((user_id, text))
+            except asyncio.QueueFull:
+                logger.warning(f"Notification queue full, dropping {service} event for {kind} {media_id}")
+                return False
+        return True
+
+    async def _worker(self):
+        while True:
+            user_id, text = await self.queue.get()
+            try:
+                await self.send(user_id, text)
+            except Exception as e:
+                logger.error(f"Error sending notification to {user_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def start(self):
+        """Start the delivery workers on the running event loop"""
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,252 @@
+"""
+Poster thumbnails for search results
+
+Posters are fetched from the image URLs in Sonarr/Radarr lookup records,
+downscaled once and kept in an on-disk, content-addressed cache with LRU
+eviction. Once Telegram has a poster it returns a file_id, which is
+remembered: showing that poster again sends no image bytes and fetches
+nothing.
+"""
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Union
+import httpx
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS poster_urls (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS poster_urls_digest ON poster_urls (digest);
+
+CREATE TABLE IF NOT EXISTS thumbnails (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    used_at REAL NOT NULL,
+    file_id TEXT
+);
+CREATE INDEX IF NOT EXISTS thumbnails_lru ON thumbnails (used_at);
+"""
+
+# TMDB serves resized variants; the original can be several MB
+TMDB_ORIGINAL = '/t/p/original/'
+TMDB_RESIZED = '/t/p/w342/'
+
+
+def poster_url(record: Dict) -> Optional[str]:
+    """Remote URL of a lookup record's poster, if it has one"""
+    for image in record.get('images') or ():
+        if image.get('coverType') == 'poster' and image.get('remoteUrl'):
+            return image['remoteUrl'].replace(TMDB_ORIGINAL, TMDB_RESIZED)
+    return None
+
+
+def downscale(data: bytes, max_width: int, max_height: int) -> bytes:
+    """Fit an image into max_width x max_height and re-encode it as JPEG"""
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEGs can be decoded straight at a fraction of their size, which is much cheaper
+        image.draft('RGB', (max_width, max_height))
+        image = image.convert('RGB')
+        image.thumbnail((max_width, max_height))
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=80, optimize=True)
+        return output.getvalue()
+
+
+class Poster(NamedTuple):
+    digest: str  # SHA-256 of the downscaled JPEG
+    file_id: Optional[str]  # Telegram's ID once uploaded
+    path: str
+
+    def media(self) -> Union[str, bytes]:
+        """What to send Telegram: the file_id if known, else the JPEG itself"""
+        if self.file_id:
+            return self.file_id
+        with open(self.path, 'rb') as poster_file:
+            return poster_file.read()
+
+
+class PosterCache:
+    """
+    Downscaled posters on disk, keyed by the hash of their content
+
+    Several URLs showing the same image share one file. When the files
+    exceed ``max_bytes`` the least recently shown are deleted; posters
+    that Telegram already holds keep their file_id, so they can still be
+    shown. Fetches run at most ``concurrency`` at a time, and concurrent
+    requests for one URL share a fetch.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_width: int = 300, max_height: int = 450,
+                 concurrency: int = 4, timeout: float = 10):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_width = max_width
+        self.max_height = max_height
+        self.timeout = timeout
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(directory, 'posters.db'), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+            self.total_bytes = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM thumbnails').fetchone()[0]
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._fetches: Dict[str, asyncio.Future] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self.file_id_hits = 0
+        self.disk_hits = 0
+        self.fetches = 0
+        self.failures = 0
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], f'{digest}.jpg')
+
+    def _cached(self, url: str) -> Optional[Poster]:
+        """The stored poster for url that can still be sent, marking it as used"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                'SELECT t.digest, t.size, t.file_id FROM poster_urls u '
+                'JOIN thumbnails t ON t.digest = u.digest WHERE u.url = ?',
+                (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            poster = Poster(row['digest'], row['file_id'], self._path(row['digest']))
+            if not poster.file_id and not (row['size'] and os.path.exists(poster.path)):
+                return None
+            self._conn.execute('UPDATE thumbnails SET used_at = ? WHERE digest = ?', (time.time(), poster.digest))
+        if poster.file_id:
+            self.file_id_hits += 1
+        else:
+            self.disk_hits += 1
+        return poster
+
+    def _store(self, url: str, data: bytes) -> Poster:
+        """Downscale and write a fetched poster, then evict down to max_bytes"""
+        thumbnail = downscale(data, self.max_width, self.max_height)
+        digest = hashlib.sha256(thumbnail).hexdigest()
+        path = self._path(digest)
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT size, file_id FROM thumbnails WHERE digest = ?', (digest,)).fetchone()
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(f'{path}.tmp', 'wb') as poster_file:
+                    poster_file.write(thumbnail)
+                os.replace(f'{path}.tmp', path)
+            self.total_bytes += len(thumbnail) - (row['size'] if row else 0)
+            self._conn.execute(
+                'INSERT INTO thumbnails (digest, size, used_at) VALUES (?, ?, ?) '
+                'ON CONFLICT (digest) DO UPDATE SET size = excluded.size, used_at = excluded.used_at',
+                (digest, len(thumbnail), time.time())
+            )
+            self._conn.execute('INSERT OR REPLACE INTO poster_urls (url, digest) VALUES (?, ?)', (url, digest))
+            self._evict()
+        return Poster(digest, row['file_id'] if row else None, path)
+
+    def _evict(self):
+        """Delete least recently used files until the cache fits; call with the lock held"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        for row in self._conn.execute(
+            'SELECT digest, size, file_id FROM thumbnails WHERE size > 0 ORDER BY used_at'
+        ).fetchall():
+            try:
+                os.remove(self._path(row['digest']))
+            except FileNotFoundError:
+                pass
+            self.total_bytes -= row['size']
+            if row['file_id']:
+                self._conn.execute('UPDATE thumbnails SET size = 0 WHERE digest = ?', (row['digest'],))
+            else:
+                self._conn.execute('DELETE FROM thumbnails WHERE digest = ?', (row['digest'],))
+                self._conn.execute('DELETE FROM poster_urls WHERE digest = ?', (row['digest'],))
+            if self.total_bytes <= self.max_bytes:
+                break
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=True)
+        return self._client
+
+    async def _fetch(self, url: str) -> Optional[Poster]:
+        async with self._semaphore:
+            try:
+                response = await self._get_client().get(url)
+                response.raise_for_status()
+                poster = await asyncio.to_thread(self._store, url, response.content)
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"Could not fetch poster {url}: {e}")
+                return None
+        self.fetches += 1
+        return poster
+
+    async def get(self, url: str) -> Optional[Poster]:
+        """
+        Poster for an image URL, fetching and caching it on first use
+
+        Returns None if it cannot be fetched. A caller that stops waiting
+        does not cancel the fetch, so the poster is ready next time.
+        """
+        poster = await asyncio.to_thread(self._cached, url)
+        if poster is not None:
+            return poster
+        fetch = self._fetches.get(url)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self._fetch(url))
+            self._fetches[url] = fetch
+            fetch.add_done_callback(lambda _: self._fetches.pop(url, None))
+        return await asyncio.shield(fetch)
+
+    async def get_many(self, urls: List[Optional[str]], wait: float) -> List[Optional[Poster]]:
+        """Posters for urls (None entries stay None), giving up on the slow ones after wait seconds"""
+        tasks = [asyncio.ensure_future(self.get(url)) if url else None for url in urls]
+        pending = [task for task in tasks if task is not None]
+        if pending:
+            await asyncio.wait(pending, timeout=wait)
+        return [task.result() if task is not None and task.done() else None for task in tasks]
+
+    def remember_file_id(self, digest: str, file_id: str):
+        """Record the file_id Telegram assigned to an uploaded poster"""
+        with self._lock, self._conn:
+            self._conn.execute('UPDATE thumbnails SET file_id = ? WHERE digest = ?', (file_id, digest))
+
+    def forget_file_ids(self, digests: List[str]):
+        """Drop file_ids Telegram rejected, so the files are uploaded again"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'UPDATE thumbnails SET file_id = NULL WHERE digest = ?', [(digest,) for digest in digests]
+            )
+            # Evicted posters that were only kept for their file_id are gone now
+            self._conn.execute(
+                'DELETE FROM poster_urls WHERE digest IN '
+                '(SELECT digest FROM thumbnails WHERE size = 0 AND file_id IS NULL)'
+            )
+            self._conn.execute('DELETE FROM thumbnails WHERE size = 0 AND file_id IS NULL')
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            'bytes': self.total_bytes,
+            'file_id_hits': self.file_id_hits,
+            'disk_hits': self.disk_hits,
+            'fetches': self.fetches,
+            'failures': self.failures,
+        }
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        with self._lock:
+            self._conn.close()
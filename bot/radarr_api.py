@@ -1,17 +1,19 @@
 """
 Radarr API Integration for ZulianTV Bot
 """
+import asyncio
 import requests
-from typing import List, Dict, Optional
+from typing import Any, AsyncIterator, Callable, List, Dict, Optional
 import config
+from arr_client import AsyncArrClient, UpstreamError
 
 
 class RadarrAPI:
     """Interface for Radarr API operations"""
 
-    def __init__(self):
-        self.base_url = config.RADARR_URL
-        self.api_key = config.RADARR_API_KEY
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        self.base_url = base_url or config.RADARR_URL
+        self.api_key = api_key or config.RADARR_API_KEY
         self.headers = {
             'X-Api-Key': self.api_key,
             'Content-Type': 'application/json'
@@ -31,6 +33,10 @@ class RadarrAPI:
         """Search for movies by name"""
         return self._make_request('GET', f'movie/lookup?term={query}')
 
+    def lookup_movie(self, tmdb_id: int) -> Dict:
+        """Look up a single movie by TMDB ID"""
+        return self._make_request('GET', f'movie/lookup/tmdb?tmdbId={tmdb_id}')
+
     def get_root_folders(self) -> List[Dict]:
         """Get available root folders for movies"""
         return self._make_request('GET', 'rootfolder')
@@ -98,11 +104,68 @@ class RadarrAPI:
 
     def search_movie(self, movie_id: int) -> Dict:
         """Trigger a search for a specific movie"""
+        return self.search_movies_by_ids([movie_id])
+
+    def search_movies_by_ids(self, movie_ids: List[int]) -> Dict:
+        """Trigger one search command covering several movies"""
         return self._make_request('POST', 'command', {
             'name': 'MoviesSearch',
-            'movieIds': [movie_id]
+            'movieIds': movie_ids
         })
 
     def get_movie_by_id(self, movie_id: int) -> Dict:
         """Get movie details by Radarr movie ID"""
         return self._make_request('GET', f'movie/{movie_id}')
+
+    def get_queue(self, page_size: int = 200) -> Dict:
+        """Get the download queue (one page of records) with movie details"""
+        return self._make_request('GET', f'queue?pageSize={page_size}&includeMovie=true')
+
+    def get_calendar(self, start: str, end: str) -> List[Dict]:
+        """Get movies with a cinema, digital or physical release between two ISO dates"""
+        return self._make_request('GET', f'calendar?start={start}&end={end}')
+
+
+class AsyncRadarrAPI(AsyncArrClient, RadarrAPI):
+    """Non-blocking Radarr client sharing RadarrAPI's method surface"""
+
+    service_name = 'Radarr'
+
+    async def search_movies(self, query: str) -> List[Dict]:
+        """Search for movies by name, served from the lookup cache when possible"""
+        return await self._cached_lookup('movie/lookup', query)
+
+    async def add_movie_by_id(self, tmdb_id: int, movie_data: Optional[Dict] = None) -> Dict:
+        """
+        Quick add movie using default settings
+        Automatically uses first root folder and quality profile
+
+        Pass movie_data (the record search_movies() returned) to skip the
+        lookup; otherwise the lookup and the (cached) defaults are fetched
+        concurrently.
+        """
+        if movie_data is None:
+            movie_data, (root_folder_path, quality_profile_id) = await asyncio.gather(
+                self._make_request('GET', f'movie/lookup/tmdb?tmdbId={tmdb_id}'),
+                self.get_defaults()
+            )
+            if not movie_data:
+                raise Exception(f"Movie with TMDB ID {tmdb_id} not found")
+        else:
+            root_folder_path, quality_profile_id = await self.get_defaults()
+
+        try:
+            return await self.add_movie(movie_data, root_folder_path, quality_profile_id)
+        except UpstreamError as e:
+            # The root folder or profile may have been removed upstream
+            if e.rejects_defaults():
+                self.invalidate_defaults()
+            raise
+
+    def stream_movies(self, project: Callable[[Dict], Any]) -> AsyncIterator[Any]:
+        """
+        Stream all movies in Radarr, yielding only project(record) for each
+
+        Keeps memory flat on large libraries, unlike get_movies_list().
+        """
+        return self._stream_list('movie', project)
@@ -0,0 +1,198 @@
+"""
+Rate limiting and fair queueing for upstream Sonarr/Radarr calls and Telegram updates
+"""
+import asyncio
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Deque, Dict, Hashable, NamedTuple, Optional
+from telegram.ext import BaseUpdateProcessor
+
+# Updates PTB itself admits at once; FairUpdateProcessor does the real limiting
+ADMITTED_UPDATES = 4096
+
+
+class BulkJob(NamedTuple):
+    """current_user while a user's /addlist runs: charged to the bulk budget, queued apart from their searches"""
+    user_id: int
+
+
+# Telegram user whose update is being handled (or their BulkJob); None for background work
+current_user: ContextVar[Optional[Hashable]] = ContextVar('current_user', default=None)
+
+
+class TokenBucket:
+    """
+    Classic token bucket: ``rate`` tokens per second, up to ``burst`` saved
+
+    acquire() never fails; when the bucket is empty it reserves the next
+    token and sleeps until it is due, so excess calls queue in order.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens < 0:
+            try:
+                await asyncio.sleep(-self.tokens / self.rate)
+            except asyncio.CancelledError:
+                self.tokens += 1
+                raise
+
+
+class UserRateLimiter:
+    """One token bucket per Telegram user (or other key)"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[int, TokenBucket] = {}
+
+    async def acquire(self, user_id: Hashable):
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = self._buckets[user_id] = TokenBucket(self.rate, self.burst)
+        await bucket.acquire()
+
+
+class FairLimiter:
+    """
+    Concurrency cap for one backend with round-robin queueing per key
+
+    When all ``max_concurrent`` slots are busy, callers wait in a queue
+    per key (the Telegram user, or None for background work), and freed
+    slots go to the keys in turn, so one user's burst cannot starve the
+    others. Queue depth and wait times are tracked for reporting.
+    """
+
+    def __init__(self, max_concurrent: int):
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.waiting = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.max_wait_seconds = 0.0
+        self._queues: 'OrderedDict[Hashable, Deque[asyncio.Future]]' = OrderedDict()
+
+    async def acquire(self, key: Hashable = None):
+        if self.active < self.max_concurrent and not self.waiting:
+            self.active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(key, deque()).append(future)
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            queue = self._queues.get(key)
+            if queue is not None and future in queue:
+                queue.remove(future)
+                self.waiting -= 1
+                if not queue:
+                    del self._queues[key]
+            elif future.done() and not future.cancelled():
+                # The slot was handed to us just before we were cancelled
+                self.release()
+            raise
+
+        waited = time.monotonic() - started
+        self.waits += 1
+        self.wait_seconds_total += waited
+        self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+    def try_acquire(self) -> bool:
+        """Take a free slot without queueing; False if there is none"""
+        if self.active < self.max_concurrent and not self.waiting:
+            self.active += 1
+            return True
+        return False
+
+    def release(self):
+        """Hand the slot straight to the next key in turn, or free it"""
+        while self._queues:
+            key, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self.waiting -= 1
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable = None):
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, float]:
+        """Queue depth and wait-time figures for logging and metrics"""
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'waits': self.waits,
+            'wait_seconds_total': self.wait_seconds_total,
+            'max_wait_seconds': self.max_wait_seconds
+        }
+
+
+class FairUpdateProcessor(BaseUpdateProcessor):
+    """
+    Runs up to ``max_concurrent`` updates at once, at most ``per_user`` of them from one user
+
+    PTB takes a slot of its own semaphore before do_process_update() is
+    called, so limiting there alone would let a user's burst occupy
+    every slot while they wait on their rate limit. Here an update first
+    waits for one of its sender's ``per_user`` slots and only then for a
+    shared one; a user's excess queues behind their own updates.
+    """
+
+    def __init__(self, max_concurrent: int, per_user: int):
+        super().__init__(max(ADMITTED_UPDATES, max_concurrent))
+        self.per_user = per_user
+        self._shared = asyncio.Semaphore(max_concurrent)
+        self._users: Dict[Hashable, asyncio.Semaphore] = {}
+        self._in_flight: Counter = Counter()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable):
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            async with self._shared:
+                await coroutine
+            return
+
+        semaphore = self._users.get(user.id)
+        if semaphore is None:
+            semaphore = self._users[user.id] = asyncio.Semaphore(self.per_user)
+        self._in_flight[user.id] += 1
+        try:
+            async with semaphore:
+                async with self._shared:
+                    await coroutine
+        finally:
+            self._in_flight[user.id] -= 1
+            if not self._in_flight[user.id]:
+                del self._in_flight[user.id]
+                del self._users[user.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -0,0 +1,201 @@
+"""
+Persistent record of which Telegram user requested which title
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    user_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    media_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    requested_at REAL NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (user_id, kind, media_id)
+);
+CREATE INDEX IF NOT EXISTS requests_media ON requests (kind, media_id);
+CREATE INDEX IF NOT EXISTS requests_user_time ON requests (user_id, requested_at);
+"""
+
+COLUMNS = ('user_id', 'kind', 'media_id', 'title', 'requested_at', 'state')
+
+# Request lifecycle, advanced by Sonarr/Radarr webhook events
+REQUESTED = 'requested'
+DOWNLOADING = 'downloading'
+DOWNLOADED = 'downloaded'
+
+
+class RequestStore:
+    """
+    SQLite store of (user, tvdbId/tmdbId, timestamp, state) with write-behind
+
+    Writes are buffered in memory and committed together by flush(),
+    which the background flusher calls every ``flush_interval`` seconds or
+    as soon as ``batch_size`` writes are waiting, so a burst of adds costs
+    one transaction. Reads merge the unflushed buffer, so they never lag.
+    They use a connection of their own, which WAL lets read while a flush
+    commits, so the event loop never waits on the fsync.
+    Lookups are indexed both by user and by (kind, media ID).
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0, batch_size: int = 100):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # _lock serializes flushes on _conn; _read_lock is only held briefly, for
+        # reads on _read_conn and for taking writes out of the buffer
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+        self._read_conn = sqlite3.connect(path, check_same_thread=False)
+        self._read_conn.row_factory = sqlite3.Row
+
+        # Unflushed writes, in order: ('record', row) or ('state', (state, kind, media_id))
+        self._pending: List[Tuple[str, Tuple]] = []
+        self._flush_now = asyncio.Event()
+
+    # Writes (buffered)
+
+    def record(self, user_id: int, kind: str, media_id: int, title: str):
+        """Remember that user_id requested a show (tvdbId) or movie (tmdbId)"""
+        self._queue(('record', (user_id, kind, media_id, title, time.time(), REQUESTED)))
+
+    def set_state(self, kind: str, media_id: int, state: str):
+        """Advance every request for a title, e.g. when a webhook reports a download"""
+        self._queue(('state', (state, kind, media_id)))
+
+    def _queue(self, operation: Tuple[str, Tuple]):
+        self._pending.append(operation)
+        if len(self._pending) >= self.batch_size:
+            self._flush_now.set()
+
+    def flush(self) -> int:
+        """
+        Commit all buffered writes in a single transaction
+
+        The commit runs without the read lock. Writes leave the buffer only
+        once committed, under the read lock, so a read always finds them in
+        one place or the other. If the commit fails they stay buffered for
+        the next flush.
+        """
+        placeholders = ', '.join('?' for _ in COLUMNS)
+        with self._lock:
+            # New writes are appended behind this batch meanwhile
+            with self._read_lock:
+                pending = self._pending[:]
+            if not pending:
+                return 0
+            with self._conn:
+                for operation, params in pending:
+                    if operation == 'record':
+                        self._conn.execute(
+                            f'INSERT OR REPLACE INTO requests ({", ".join(COLUMNS)}) VALUES ({placeholders})',
+                            params
+                        )
+                    else:
+                        self._conn.execute(
+                            'UPDATE requests SET state = ? WHERE kind = ? AND media_id = ?',
+                            params
+                        )
+            with self._read_lock:
+                del self._pending[:len(pending)]
+        return len(pending)
+
+    async def run_flusher(self):
+        """Flush buffered writes periodically, or early when a batch fills up"""
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_now.clear()
+                try:
+                    await asyncio.to_thread(self.flush)
+                except sqlite3.Error as e:
+                    logger.error(f"Error flushing request store: {e}")
+        finally:
+            self.flush()
+
+    def close(self):
+        self.flush()
+        with self._lock, self._read_lock:
+            self._conn.close()
+            self._read_conn.close()
+
+    # Reads
+
+    @staticmethod
+    def _pending_state(pending: List[Tuple[str, Tuple]], kind: str, media_id: int, state: str) -> str:
+        for operation, params in pending:
+            if operation == 'state' and params[1:] == (kind, media_id):
+                state = params[0]
+        return state
+
+    def requesters(self, kind: str, media_id: int) -> Set[int]:
+        """Users who requested a title (indexed by kind + media ID)"""
+        with self._read_lock:
+            users = {
+                row[0] for row in self._read_conn.execute(
+                    'SELECT user_id FROM requests WHERE kind = ? AND media_id = ?',
+                    (kind, media_id)
+                )
+            }
+            pending = self._pending[:]
+        users.update(
+            params[0] for operation, params in pending
+            if operation == 'record' and params[1:3] == (kind, media_id)
+        )
+        return users
+
+    def requested_since(self, kind: str, since: float) -> Dict[int, float]:
+        """Media IDs of a kind requested after since, with their latest request time"""
+        with self._read_lock:
+            requested = {
+                row[0]: row[1] for row in self._read_conn.execute(
+                    'SELECT media_id, MAX(requested_at) FROM requests '
+                    'WHERE kind = ? AND requested_at > ? GROUP BY media_id',
+                    (kind, since)
+                )
+            }
+            pending = self._pending[:]
+        for operation, params in pending:
+            if operation == 'record' and params[1] == kind and params[4] > since:
+                requested[params[2]] = max(requested.get(params[2], 0), params[4])
+        return requested
+
+    def for_user(self, user_id: int, limit: int = 20) -> List[Dict]:
+        """A user's most recent requests, newest first (indexed by user + time)"""
+        with self._read_lock:
+            rows = {
+                (row['kind'], row['media_id']): dict(row)
+                for row in self._read_conn.execute(
+                    'SELECT * FROM requests WHERE user_id = ? ORDER BY requested_at DESC LIMIT ?',
+                    (user_id, limit)
+                )
+            }
+            pending = self._pending[:]
+        for operation, params in pending:
+            if operation == 'record' and params[0] == user_id:
+                rows[(params[1], params[2])] = dict(zip(COLUMNS, params))
+        for request in rows.values():
+            request['state'] = self._pending_state(
+                pending, request['kind'], request['media_id'], request['state']
+            )
+
+        return sorted(rows.values(), key=lambda request: request['requested_at'], reverse=True)[:limit]
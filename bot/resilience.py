@@ -0,0 +1,74 @@
+"""
+Circuit breaking for flapping Sonarr/Radarr backends
+"""
+import logging
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackendUnavailable(Exception):
+    """Raised without contacting upstream while a backend's circuit is open"""
+
+
+class BackendUnreachable(BackendUnavailable):
+    """
+    Raised when a backend timed out or failed transiently
+
+    The message is meant for users; what actually went wrong is in ``detail``.
+    """
+
+    def __init__(self, name: str, detail: str):
+        super().__init__(f"{name} is not responding right now. Please try again in a minute.")
+        self.detail = detail
+
+
+class CircuitBreaker:
+    """
+    Per-backend circuit breaker
+
+    After ``failure_threshold`` consecutive failed calls the circuit opens
+    and calls fail fast with BackendUnavailable. Every ``reset_timeout``
+    seconds one call is let through as a half-open probe: success closes
+    the circuit, failure keeps it open for another interval.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def before_call(self):
+        """Raise BackendUnavailable unless the call may go upstream"""
+        if self.opened_at is None:
+            return
+        now = time.monotonic()
+        if now - self.opened_at < self.reset_timeout:
+            raise BackendUnavailable(
+                f"{self.name} is temporarily unavailable (it may be restarting). Please try again in a minute."
+            )
+        # Half-open: this call is the probe; others keep failing fast until the next interval
+        self.opened_at = now
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info(f"{self.name} circuit closed, backend is responding again")
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, float]:
+        return {'open': int(self.is_open), 'consecutive_failures': self.failures}
@@ -1,17 +1,19 @@
 """
 Sonarr API Integration for ZulianTV Bot
 """
+import asyncio
 import requests
-from typing import List, Dict, Optional
+from typing import Any, AsyncIterator, Callable, List, Dict, Optional
 import config
+from arr_client import AsyncArrClient, UpstreamError
 
 
 class SonarrAPI:
     """Interface for Sonarr API operations"""
 
-    def __init__(self):
-        self.base_url = config.SONARR_URL
-        self.api_key = config.SONARR_API_KEY
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        self.base_url = base_url or config.SONARR_URL
+        self.api_key = api_key or config.SONARR_API_KEY
         self.headers = {
             'X-Api-Key': self.api_key,
             'Content-Type': 'application/json'
@@ -99,12 +101,77 @@ class SonarrAPI:
 
     def search_episode(self, episode_id: int) -> Dict:
         """Trigger a search for a specific episode"""
-        payload = {'episodeIds': [episode_id]}
+        return self.search_episodes([episode_id])
+
+    def search_episodes(self, episode_ids: List[int]) -> Dict:
+        """Trigger one search command covering several episodes"""
         return self._make_request('POST', 'command', {
             'name': 'EpisodeSearch',
-            'episodeIds': [episode_id]
+            'episodeIds': episode_ids
         })
 
+    def get_missing_episodes(self, page: int = 1, page_size: int = 1000) -> Dict:
+        """Get one page of aired, monitored episodes without a file, most recently aired first"""
+        return self._make_request(
+            'GET',
+            f'wanted/missing?page={page}&pageSize={page_size}&monitored=true'
+            f'&sortKey=airDateUtc&sortDirection=descending'
+        )
+
     def get_series_by_id(self, series_id: int) -> Dict:
         """Get series details by Sonarr series ID"""
         return self._make_request('GET', f'series/{series_id}')
+
+    def get_queue(self, page_size: int = 200) -> Dict:
+        """Get the download queue (one page of records) with series and episode details"""
+        return self._make_request('GET', f'queue?pageSize={page_size}&includeSeries=true&includeEpisode=true')
+
+    def get_calendar(self, start: str, end: str) -> List[Dict]:
+        """Get episodes airing between two ISO dates, with their series"""
+        return self._make_request('GET', f'calendar?start={start}&end={end}&includeSeries=true')
+
+
+class AsyncSonarrAPI(AsyncArrClient, SonarrAPI):
+    """Non-blocking Sonarr client sharing SonarrAPI's method surface"""
+
+    service_name = 'Sonarr'
+
+    async def search_series(self, query: str) -> List[Dict]:
+        """Search for TV series by name, served from the lookup cache when possible"""
+        return await self._cached_lookup('series/lookup', query)
+
+    async def add_series_by_id(self, tvdb_id: int, series_data: Optional[Dict] = None) -> Dict:
+        """
+        Quick add series using default settings
+        Automatically uses first root folder and quality profile
+
+        Pass series_data (the record search_series() returned) to skip the
+        lookup; otherwise the lookup and the (cached) defaults are fetched
+        concurrently.
+        """
+        if series_data is None:
+            search_results, (root_folder_path, quality_profile_id) = await asyncio.gather(
+                self._make_request('GET', f'series/lookup?term=tvdb:{tvdb_id}'),
+                self.get_defaults()
+            )
+            if not search_results:
+                raise Exception(f"Series with TVDB ID {tvdb_id} not found")
+            series_data = search_results[0]
+        else:
+            root_folder_path, quality_profile_id = await self.get_defaults()
+
+        try:
+            return await self.add_series(series_data, root_folder_path, quality_profile_id)
+        except UpstreamError as e:
+            # The root folder or profile may have been removed upstream
+            if e.rejects_defaults():
+                self.invalidate_defaults()
+            raise
+
+    def stream_series(self, project: Callable[[Dict], Any]) -> AsyncIterator[Any]:
+        """
+        Stream all series in Sonarr, yielding only project(record) for each
+
+        Keeps memory flat on large libraries, unlike get_series_list().
+        """
+        return self._stream_list('series', project)
@@ -0,0 +1,119 @@
+"""
+In-memory fuzzy title index over the library, for "do we already have it?"
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+WORD_RE = re.compile(r'[^\W_]+')
+
+Key = Tuple[str, int]  # ('show' | 'movie', library index row ID)
+
+# A query this short (e.g. 'the' has 4 trigrams) shares enough trigrams with
+# any title starting with it to pass the usual threshold, so it must match closely
+SHORT_QUERY_TRIGRAMS = 6
+SHORT_QUERY_MIN_SCORE = 0.8
+
+
+def trigrams(text: str) -> Set[str]:
+    """pg_trgm-style trigrams: each word padded with two leading spaces and one trailing"""
+    grams = set()
+    for word in WORD_RE.findall(text.casefold()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a: str, b: str) -> float:
+    """Dice coefficient of two strings' trigram sets (0..1)"""
+    grams_a, grams_b = trigrams(a), trigrams(b)
+    if not grams_a or not grams_b:
+        return 0.0
+    return 2 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+class TitleMatch(NamedTuple):
+    score: float
+    kind: str
+    id: int
+    title: str
+    year: Optional[int]
+
+
+class TitleIndex:
+    """
+    Trigram inverted index over show and movie titles
+
+    Kept up to date incrementally from library index changes, so a query
+    only touches the postings of its own trigrams.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Set[Key]] = {}
+        self._entries: Dict[Key, Tuple[str, Optional[int], Set[str]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, kind: str, item_id: int, title: str, year: Optional[int] = None):
+        key = (kind, item_id)
+        self.remove(kind, item_id)
+        grams = trigrams(title)
+        self._entries[key] = (title, year, grams)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(key)
+
+    def remove(self, kind: str, item_id: int):
+        key = (kind, item_id)
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for gram in entry[2]:
+            keys = self._postings.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[gram]
+
+    def library_changed(self, table: str, rows: Iterable[Tuple], removed_ids: Iterable[int]):
+        """LibraryIndex change listener: rows are (row_id, instance, *SHOW_COLUMNS/MOVIE_COLUMNS)"""
+        kind = 'show' if table == 'shows' else 'movie'
+        for row in rows:
+            self.add(kind, row[0], row[4], row[6])
+        for item_id in removed_ids:
+            self.remove(kind, item_id)
+
+    def search(self, query: str, kind: Optional[str] = None, limit: int = 5,
+               min_score: float = 0.45) -> List[TitleMatch]:
+        """
+        Best title matches for query, optionally limited to 'show' or 'movie'
+
+        A title held by several instances (e.g. 1080p and 4K) is listed once.
+        Short queries need at least SHORT_QUERY_MIN_SCORE.
+        """
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        if len(query_grams) < SHORT_QUERY_TRIGRAMS:
+            min_score = max(min_score, SHORT_QUERY_MIN_SCORE)
+
+        shared = Counter()
+        for gram in query_grams:
+            shared.update(self._postings.get(gram, ()))
+
+        matches = []
+        for key, count in shared.items():
+            if kind is not None and key[0] != kind:
+                continue
+            title, year, grams = self._entries[key]
+            score = 2 * count / (len(query_grams) + len(grams))
+            if score >= min_score:
+                matches.append(TitleMatch(score, key[0], key[1], title, year))
+
+        matches.sort(key=lambda match: match.score, reverse=True)
+        unique = {}
+        for match in matches:
+            unique.setdefault((match.kind, match.title.casefold(), match.year), match)
+            if len(unique) == limit:
+                break
+        return list(unique.values())
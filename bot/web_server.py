@@ -0,0 +1,65 @@
+"""
+Local HTTP endpoint served from the bot's own event loop
+
+Receives Sonarr/Radarr Connect webhooks (Settings -> Connect -> Webhook,
+URL http://zuliantv-bot:8000/webhook/sonarr?token=...) and serves
+Prometheus metrics at /metrics.
+"""
+import hmac
+import json
+import logging
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+import config
+
+logger = logging.getLogger(__name__)
+
+NOTIFIER_KEY = web.AppKey('notifier')
+
+
+def _authorized(request: web.Request) -> bool:
+    """Check the shared webhook token (the route only exists when one is configured)"""
+    return hmac.compare_digest(request.query.get('token', ''), config.ARR_WEBHOOK_TOKEN)
+
+
+async def arr_webhook(request: web.Request) -> web.Response:
+    """Accept a Connect webhook and hand it to the notifier without waiting on delivery"""
+    service = request.match_info['service']
+    if not _authorized(request):
+        return web.Response(status=401)
+
+    try:
+        payload = await request.json()
+    except json.JSONDecodeError:
+        return web.Response(status=400, text="Invalid JSON")
+    if not isinstance(payload, dict):
+        return web.Response(status=400, text="Expected a JSON object")
+
+    if not request.app[NOTIFIER_KEY].handle_event(service, payload):
+        return web.Response(status=503, text="Notification queue full")
+    return web.Response(status=202)
+
+
+async def metrics(request: web.Request) -> web.Response:
+    """Prometheus text exposition of everything in the default registry"""
+    return web.Response(body=generate_latest(), headers={'Content-Type': CONTENT_TYPE_LATEST})
+
+
+def create_web_app(notifier) -> web.Application:
+    app = web.Application()
+    app[NOTIFIER_KEY] = notifier
+    if config.ARR_WEBHOOK_TOKEN:
+        app.router.add_post('/webhook/{service:sonarr|radarr}', arr_webhook)
+    else:
+        logger.warning("ARR_WEBHOOK_TOKEN is not set, Sonarr/Radarr webhooks (download notifications) are disabled")
+    app.router.add_get('/metrics', metrics)
+    return app
+
+
+async def start_web_server(app: web.Application, host: str, port: int) -> web.AppRunner:
+    """Serve app on the already running event loop; returns the runner to clean up later"""
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"HTTP endpoint listening on {host}:{port}")
+    return runner
@@ -0,0 +1,62 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import config
+from arr_client import UpstreamError
+from sonarr_api import AsyncSonarrAPI
+
+SERIES = {'tvdbId': 1, 'title': 'Show', 'titleSlug': 'show'}
+
+
+def sonarr_rejecting_adds(tmp_path, monkeypatch, status_code, body):
+    """A Sonarr client whose backend answers every add with status_code/body; counts defaults loads"""
+    monkeypatch.setattr(config, 'DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(config, 'HEDGE_DELAY', 0)
+    requests = []
+
+    def handler(request):
+        path = request.url.path.rsplit('/', 1)[-1]
+        requests.append(path)
+        if path == 'rootfolder':
+            return httpx.Response(200, json=[{'path': '/tv'}])
+        if path == 'qualityprofile':
+            return httpx.Response(200, json=[{'id': 1}])
+        return httpx.Response(status_code, content=json.dumps(body))
+
+    client = AsyncSonarrAPI('http://sonarr', 'key')
+    client._client = httpx.AsyncClient(base_url='http://sonarr/api/v3/', transport=httpx.MockTransport(handler))
+    return client, requests
+
+
+async def add_twice(client):
+    errors = []
+    for _ in range(2):
+        try:
+            await client.add_series_by_id(1, SERIES)
+        except Exception as e:
+            errors.append(e)
+    await client.close()
+    return errors
+
+
+@pytest.mark.parametrize('status_code, body', [
+    (500, {'message': 'database is locked'}),
+    (400, [{'propertyName': 'TvdbId', 'errorMessage': 'This series has already been added'}]),
+])
+def test_unrelated_add_failures_keep_cached_defaults(tmp_path, monkeypatch, status_code, body):
+    client, requests = sonarr_rejecting_adds(tmp_path, monkeypatch, status_code, body)
+    errors = asyncio.run(add_twice(client))
+    assert len(errors) == 2
+    assert requests.count('rootfolder') == 1
+    assert (tmp_path / 'sonarr_defaults.json').exists()
+
+
+def test_rejected_root_folder_invalidates_cached_defaults(tmp_path, monkeypatch):
+    body = [{'propertyName': 'RootFolderPath', 'errorMessage': "Root folder '/tv' does not exist"}]
+    client, requests = sonarr_rejecting_adds(tmp_path, monkeypatch, 400, body)
+    errors = asyncio.run(add_twice(client))
+    assert all(isinstance(error, UpstreamError) for error in errors)
+    assert requests.count('rootfolder') == 2
@@ -0,0 +1,30 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from bulk_add import BulkAdder
+
+
+async def sonarr_down(query):
+    raise Exception("Sonarr API error: connection refused")
+
+
+async def radarr_lookup(query):
+    return [{'title': 'Heat', 'year': 1995, 'tmdbId': 949}] if query == 'Heat' else []
+
+
+def adder():
+    sonarr = SimpleNamespace(default=SimpleNamespace(search_series=sonarr_down))
+    radarr = SimpleNamespace(default=SimpleNamespace(search_movies=radarr_lookup))
+    return BulkAdder(sonarr, radarr, library=None)
+
+
+def test_resolve_survives_one_backend_failing():
+    kind, record = asyncio.run(adder()._resolve('Heat (1995)'))
+    assert (kind, record['tmdbId']) == ('movie', 949)
+
+
+def test_resolve_fails_when_unmatched_and_a_backend_failed():
+    with pytest.raises(Exception, match='Sonarr'):
+        asyncio.run(adder()._resolve('Severance'))
@@ -0,0 +1,73 @@
+import asyncio
+
+from instances import InstancePool
+from library_index import LibraryIndex
+from resilience import CircuitBreaker
+
+
+class FakeClient:
+    def __init__(self, instance, down=False):
+        self.instance = instance
+        self.display_name = f'Sonarr ({instance})'
+        self.breaker = CircuitBreaker(self.display_name, failure_threshold=1)
+        self.down = down
+        self.listings = 0
+
+    async def stream_series(self, convert):
+        self.listings += 1
+        if self.down:
+            self.breaker.record_failure()
+            raise Exception(f"{self.display_name} API error: connection refused")
+        for series_id in range(3):
+            yield convert({'id': series_id, 'title': f'Show {series_id}', 'sortTitle': f'show {series_id}'})
+
+    async def stream_movies(self, convert):
+        self.listings += 1
+        return
+        yield
+
+
+def test_on_demand_sync_skips_fresh_and_broken_instances(tmp_path):
+    async def scenario():
+        index = LibraryIndex(str(tmp_path / 'library.db'))
+        healthy, broken, radarr = FakeClient('default'), FakeClient('4k', down=True), FakeClient('default')
+        task = asyncio.create_task(index.run_sync(
+            InstancePool({'default': healthy, '4k': broken}), InstancePool({'default': radarr}), interval=300
+        ))
+        await asyncio.sleep(0.05)
+
+        # Ten views of /myshows while the 4k instance is down
+        for _ in range(10):
+            index.request_sync('shows', max_age=60)
+            await asyncio.sleep(0.01)
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        index.close()
+        return healthy.listings, broken.listings, radarr.listings
+
+    # Only the scheduled sync at startup
+    assert asyncio.run(scenario()) == (1, 1, 1)
+
+
+def test_on_demand_sync_refreshes_only_the_stale_library(tmp_path):
+    async def scenario():
+        index = LibraryIndex(str(tmp_path / 'library.db'))
+        sonarr, radarr = FakeClient('default'), FakeClient('default')
+        task = asyncio.create_task(index.run_sync(
+            InstancePool({'default': sonarr}), InstancePool({'default': radarr}), interval=300
+        ))
+        await asyncio.sleep(0.05)
+
+        for _ in range(5):
+            index.request_sync('shows', max_age=0)
+            await asyncio.sleep(0.01)
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        index.close()
+        return sonarr.listings, radarr.listings
+
+    sonarr_listings, radarr_listings = asyncio.run(scenario())
+    assert sonarr_listings > 1
+    assert radarr_listings == 1
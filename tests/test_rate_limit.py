@@ -0,0 +1,55 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from rate_limit import FairUpdateProcessor
+
+
+def update_from(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id))
+
+
+def test_spamming_user_does_not_delay_others():
+    async def scenario():
+        processor = FairUpdateProcessor(max_concurrent=4, per_user=2)
+        started = {}
+
+        async def handler(name, seconds):
+            started[name] = time.monotonic()
+            await asyncio.sleep(seconds)
+
+        # User 1 sends 60 slow updates (as if waiting on their rate limit)
+        spam = [
+            asyncio.create_task(processor.process_update(update_from(1), handler(('spam', i), 0.05)))
+            for i in range(60)
+        ]
+        await asyncio.sleep(0.01)
+        sent = time.monotonic()
+        await processor.process_update(update_from(2), handler('other', 0))
+        waited = started['other'] - sent
+
+        await asyncio.gather(*spam)
+        return waited, processor
+
+    waited, processor = asyncio.run(scenario())
+    # The spam alone keeps user 1 busy for 1.5s
+    assert waited < 0.1
+    assert not processor._users
+
+
+def test_user_updates_limited_to_per_user():
+    async def scenario():
+        processor = FairUpdateProcessor(max_concurrent=8, per_user=2)
+        running = peak = 0
+
+        async def handler():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        await asyncio.gather(*(processor.process_update(update_from(1), handler()) for _ in range(10)))
+        return peak
+
+    assert asyncio.run(scenario()) == 2